@@ -0,0 +1,193 @@
+const { spawn } = require('child_process');
+const readline = require('readline');
+
+// Pool of long-lived `backtester.py --serve` processes.
+// Each worker answers one JSON-lines request at a time; requests queue until a worker is free.
+// A request that is not answered within its timeout is rejected, and the worker running it is restarted.
+// Workers that die before they are ready fail the queued requests and are restarted with a growing delay.
+const DEFAULT_TIMEOUT_MS = 10 * 60 * 1000;
+const RESTART_DELAY_MS = 500;
+const MAX_RESTART_DELAY_MS = 30 * 1000;
+
+class BacktestWorkerPool {
+  constructor({ pythonPath, scriptPath, size = 2, timeoutMs = DEFAULT_TIMEOUT_MS, log = () => {} }) {
+    this.pythonPath = pythonPath;
+    this.scriptPath = scriptPath;
+    this.size = size;
+    this.timeoutMs = timeoutMs;
+    this.log = log;
+    this.workers = [];
+    this.queue = [];
+    this.nextId = 1;
+    this.closing = false;
+    // Workers in a row that died before sending ready; sets the restart delay
+    this.startFailures = 0;
+    this.restartTimers = new Set();
+    for (let i = 0; i < size; i++) {
+      this.workers.push(this.startWorker());
+    }
+  }
+
+  startWorker() {
+    const worker = { process: null, ready: false, started: false, dead: false, current: null };
+    worker.process = spawn(this.pythonPath, [this.scriptPath, '--serve']);
+
+    // Writes to a worker that just died fail with EPIPE; the exit handler deals with the worker
+    worker.process.stdin.on('error', (err) => {
+      this.log(`Python worker ${worker.process.pid} stdin error: ${err.message}`);
+    });
+
+    const lines = readline.createInterface({ input: worker.process.stdout });
+    lines.on('line', (line) => this.handleLine(worker, line));
+
+    worker.process.stderr.on('data', (data) => {
+      this.log(`Python worker ${worker.process.pid} stderr: ${data.toString().trim()}`);
+    });
+
+    worker.process.on('exit', (code) => this.workerDied(worker, `exited with code ${code}`));
+
+    // A process that cannot be spawned (e.g. a bad pythonPath) only emits 'error', never 'exit'
+    worker.process.on('error', (err) => {
+      worker.process.kill();
+      this.workerDied(worker, `failed: ${err.message}`);
+    });
+
+    return worker;
+  }
+
+  workerDied(worker, reason) {
+    if (worker.dead) return;
+    worker.dead = true;
+    worker.ready = false;
+    this.log(`Python worker ${worker.process.pid} ${reason}`);
+    if (worker.current) {
+      this.finish(worker).reject(new Error(`Backtest worker ${reason}`));
+    }
+    if (!worker.started) {
+      this.startFailures += 1;
+      // With no working worker left the queued requests would wait on a pool that may never start
+      if (!this.workers.some((w) => w.started && !w.dead)) {
+        this.rejectQueued(new Error(`Backtest worker ${reason} before it was ready`));
+      }
+    }
+
+    // Replace the dead worker so the pool keeps its size
+    const index = this.workers.indexOf(worker);
+    if (index === -1 || this.closing) return;
+    const delay = this.startFailures > 0
+      ? Math.min(RESTART_DELAY_MS * 2 ** (this.startFailures - 1), MAX_RESTART_DELAY_MS)
+      : 0;
+    const timer = setTimeout(() => {
+      this.restartTimers.delete(timer);
+      if (!this.closing) this.workers[index] = this.startWorker();
+    }, delay);
+    this.restartTimers.add(timer);
+  }
+
+  rejectQueued(error) {
+    for (const job of this.queue.splice(0)) {
+      clearTimeout(job.timer);
+      job.reject(error);
+    }
+  }
+
+  handleLine(worker, line) {
+    if (line.trim() === '') return;
+    let message;
+    try {
+      message = JSON.parse(line);
+    } catch (e) {
+      this.log(`Unparseable line from python worker: ${line}`);
+      // The reply to the current request may be lost; fail it rather than wait forever
+      if (worker.current) {
+        this.finish(worker).reject(new Error(`Invalid response from backtest worker: ${e.message}`));
+        this.dispatch();
+      }
+      return;
+    }
+
+    if (message.id === null && message.type === 'result' && message.result.ready) {
+      worker.ready = true;
+      worker.started = true;
+      this.startFailures = 0;
+      this.dispatch();
+      return;
+    }
+
+    const job = worker.current;
+    if (!job || message.id !== job.id) return;
+
+    if (message.type === 'event') {
+      if (job.onEvent) job.onEvent(message.event);
+      return;
+    }
+
+    this.finish(worker);
+    if (message.type === 'error') {
+      job.reject(new Error(message.message));
+    } else {
+      job.resolve(message.result);
+    }
+    this.dispatch();
+  }
+
+  // Detach the current job from the worker and stop its timer
+  finish(worker) {
+    const job = worker.current;
+    worker.current = null;
+    clearTimeout(job.timer);
+    return job;
+  }
+
+  timeout(job) {
+    const queued = this.queue.indexOf(job);
+    if (queued !== -1) {
+      this.queue.splice(queued, 1);
+      job.reject(new Error(`Backtest request timed out after ${job.timeoutMs} ms waiting for a worker`));
+      return;
+    }
+    const worker = this.workers.find((w) => w.current === job);
+    if (!worker) return;
+    this.log(`Backtest request ${job.id} timed out after ${job.timeoutMs} ms; restarting worker ${worker.process.pid}`);
+    this.finish(worker).reject(new Error(`Backtest request timed out after ${job.timeoutMs} ms`));
+    // The python side cannot be interrupted mid-request; the exit handler starts a replacement
+    worker.ready = false;
+    worker.process.kill();
+  }
+
+  dispatch() {
+    for (const worker of this.workers) {
+      if (this.queue.length === 0) return;
+      if (!worker.ready || worker.current) continue;
+      const job = this.queue.shift();
+      worker.current = job;
+      worker.process.stdin.write(JSON.stringify(job.request) + '\n');
+    }
+  }
+
+  // Resolves with the request's result; onEvent receives stream events as they arrive.
+  // timeoutMs counts from the moment the request is queued, so it also bounds the wait for a worker (0: no limit).
+  request(command, payload, onEvent = null, { timeoutMs = this.timeoutMs } = {}) {
+    return new Promise((resolve, reject) => {
+      const id = String(this.nextId++);
+      const job = { id, request: { id, command, ...payload }, resolve, reject, onEvent, timeoutMs, timer: null };
+      if (timeoutMs > 0) {
+        job.timer = setTimeout(() => this.timeout(job), timeoutMs);
+      }
+      this.queue.push(job);
+      this.dispatch();
+    });
+  }
+
+  close() {
+    this.closing = true;
+    for (const timer of this.restartTimers) clearTimeout(timer);
+    this.restartTimers.clear();
+    for (const worker of this.workers) {
+      if (worker.dead) continue;
+      worker.process.stdin.end(JSON.stringify({ id: 'shutdown', command: 'shutdown' }) + '\n');
+    }
+  }
+}
+
+module.exports = { BacktestWorkerPool };
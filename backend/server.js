@@ -1,11 +1,11 @@
 const express = require('express');
 const cors = require('cors');
 const multer = require('multer');
-const { spawn } = require('child_process');
 const path = require('path');
 const fs = require('fs');
 const WebSocket = require('ws'); // Import WebSocket library
 const { v4: uuidv4 } = require('uuid'); // Import uuid for unique IDs
+const { BacktestWorkerPool } = require('./backtestWorkers');
 
 // Add fs for logging
 const fsPromises = require('fs/promises');
@@ -27,6 +27,19 @@ app.use(express.json());
 
 const upload = multer({ dest: 'uploads/' });
 
+const pythonPath = '/home/steve/trading_app/trading_system/venv/bin/python3';
+const pythonScriptPath = path.join(__dirname, '..', 'trading_system', 'backtester.py');
+
+// Warm python workers keep pandas imported and recently used datasets / indicators in memory
+const backtestWorkers = new BacktestWorkerPool({
+  pythonPath,
+  scriptPath: pythonScriptPath,
+  size: Number(process.env.BACKTEST_WORKERS) || 2,
+  // Per-request limit, including the wait for a free worker; a worker that exceeds it is restarted
+  timeoutMs: Number(process.env.BACKTEST_TIMEOUT_MS) || undefined,
+  log: logToFile,
+});
+
 app.post('/run-backtest', async (req, res) => {
   await logToFile('Received backtest request');
   await logToFile(`Request headers: ${JSON.stringify(req.headers)}`);
@@ -62,33 +75,27 @@ app.post('/run-backtest', async (req, res) => {
       return res.status(400).send(`Error parsing config: ${e.message}`);
     }
 
-    const pythonScriptPath = path.join(__dirname, '..', 'trading_system', 'backtester.py');
-    await logToFile(`Python script path: ${pythonScriptPath}`);
-
-    const pythonProcess = spawn('/home/steve/trading_app/trading_system/venv/bin/python3', [
-      pythonScriptPath,
-      '--filepath', dataFile.path,
-      '--atr_mult_sl', config.atr_mult_sl,
-      '--atr_mult_trail', config.atr_mult_trail,
-      '--rr_target', config.rr_target,
-    ]);
-
-    let stdoutOutput = '';
-    let stderrOutput = '';
-
-    pythonProcess.stdout.on('data', (data) => {
-      stdoutOutput += data.toString();
-      logToFile(`Python stdout: ${data.toString().trim()}`);
-    });
-
-    pythonProcess.stderr.on('data', (data) => {
-      stderrOutput += data.toString();
-      console.error(`stderr: ${stderrOutput}`); // Keep console error for immediate visibility
-      logToFile(`Python stderr: ${stderrOutput.trim()}`);
-    });
-
-    pythonProcess.on('close', async (code) => {
-      await logToFile(`child process exited with code ${code}`);
+    let results;
+    try {
+      results = await backtestWorkers.request('backtest', {
+        filepath: path.resolve(dataFile.path),
+        // Uploads are one-off files, so skip the on-disk data cache for them; the workers keep recent
+        // uploads in memory keyed by content, so re-uploading the same file skips the parse and the indicators
+        use_cache: false,
+        params: {
+          atr_mult_sl: Number(config.atr_mult_sl),
+          atr_mult_trail: Number(config.atr_mult_trail),
+          rr_target: Number(config.rr_target),
+        },
+        // Adds a per-stage "timings" block to the results (see trading_system/profiler.py)
+        profile: Boolean(config.profile),
+        // LTTB-downsampled equity curve instead of one point per bar (see trading_system/metrics.py)
+        equity_points: Number(config.equity_points) || 2000,
+      });
+    } catch (e) {
+      await logToFile(`Error running backtest: ${e.message}`);
+      return res.status(500).send(`Error running backtest: ${e.message}`);
+    } finally {
       // Clean up the uploaded file
       try {
         fs.unlinkSync(dataFile.path);
@@ -96,42 +103,15 @@ app.post('/run-backtest', async (req, res) => {
       } catch (unlinkErr) {
         await logToFile(`Error cleaning up file ${dataFile.path}: ${unlinkErr.message}`);
       }
+    }
 
-      try {
-        const results = JSON.parse(stdoutOutput); // Use stdoutOutput here
-        await logToFile(`Python script results: ${JSON.stringify(results)}`);
-
-        // Save results to a file
-        const backtestId = uuidv4();
-        const resultsFilePath = path.join(__dirname, 'backtest_results', `${backtestId}.json`);
-        await fsPromises.writeFile(resultsFilePath, JSON.stringify(results, null, 2));
-        await logToFile(`Backtest results saved to: ${resultsFilePath}`);
-
-        res.json({ ...results, backtestId }); // Send back results and the ID
-        // // Stop the app completely after each backtest as requested by the user.
-        // // This will kill both the backend and frontend processes.
-        // // The user will need to manually restart the servers to run another backtest.
-        // setTimeout(() => {
-        //   console.log('Shutting down backend server...');
-        //   process.kill(process.pid, 'SIGTERM'); // Kill backend process
-        // }, 1000); // Give some time for the response to be sent
-
-        // // Also kill the frontend process. This assumes the frontend is running in a separate process.
-        // // The PGID for the frontend was 15418 from the last restart.
-        // setTimeout(() => {
-        //   console.log('Shutting down frontend server...');
-        //   process.kill(15418, 'SIGTERM'); // Kill frontend process
-        // }, 1500); // Give some time for backend to start shutting down
-      } catch (e) {
-        await logToFile(`Error parsing JSON from python script: ${e.message}. Python stdout: ${stdoutOutput}. Python stderr: ${stderrOutput}`); // Include stderrOutput in error log
-        res.status(500).send(`Error running backtest: ${e.message}. Python stdout: ${stdoutOutput}. Python stderr: ${stderrOutput}`); // Include stderrOutput in response
-      }
-    });
+    // Save results to a file
+    const backtestId = uuidv4();
+    const resultsFilePath = path.join(__dirname, 'backtest_results', `${backtestId}.json`);
+    await fsPromises.writeFile(resultsFilePath, JSON.stringify(results, null, 2));
+    await logToFile(`Backtest results saved to: ${resultsFilePath}`);
 
-    pythonProcess.on('error', async (err) => {
-      await logToFile(`Failed to start python process: ${err.message}`);
-      res.status(500).send(`Failed to start backtest process: ${err.message}`);
-    });
+    res.json({ ...results, backtestId }); // Send back results and the ID
 
   } catch (error) {
     await logToFile(`Unhandled error in /run-backtest: ${error.message}`);
@@ -158,6 +138,7 @@ app.get('/list-backtests', async (req, res) => {
           losses: results.losses,
           win_rate: results.win_rate,
           avg_pnl: results.avg_pnl,
+          metrics: results.metrics,
           // Add other summary fields as needed
         });
       }
@@ -186,7 +167,7 @@ app.get('/download-backtest/:id', async (req, res) => {
 });
 
 app.get('/stream-data', async (req, res) => {
-  const { filename, atr_mult_sl, atr_mult_trail, rr_target } = req.query;
+  const { filename, atr_mult_sl, atr_mult_trail, rr_target, encoding, batch_bars, batch_ms, max_fps, stats_ms } = req.query;
   if (!filename) {
     return res.status(400).send('Filename is required for streaming.');
   }
@@ -196,60 +177,41 @@ app.get('/stream-data', async (req, res) => {
     return res.status(404).send('File not found.');
   }
 
-  const pythonScriptPath = path.join(__dirname, '..', 'trading_system', 'backtester.py');
-  
-  // Spawn the Python process in streaming mode
-  const pythonProcess = spawn('/home/steve/trading_app/trading_system/venv/bin/python3', [
-    pythonScriptPath,
-    '--filepath', filePath,
-    '--atr_mult_sl', atr_mult_sl || '1.094', // Use default if not provided
-    '--atr_mult_trail', atr_mult_trail || '4.093', // Use default if not provided
-    '--rr_target', rr_target || '3.990', // Use default if not provided
-    '--stream' // Enable streaming mode
-  ]);
-
-  let buffer = '';
-  pythonProcess.stdout.on('data', (data) => {
-    buffer += data.toString();
-    let lines = buffer.split('\n');
-    buffer = lines.pop(); // Keep the last (possibly incomplete) line in buffer
-
-    lines.forEach(line => {
-      if (line.trim() === '') return;
-      try {
-        const parsedData = JSON.parse(line);
-        wss.clients.forEach(client => {
-          if (client.readyState === WebSocket.OPEN) {
-            client.send(JSON.stringify(parsedData));
-          }
-        });
-      } catch (e) {
-        console.error('Error parsing JSON from Python:', e, 'Line:', line);
-      }
-    });
-  });
-
-  pythonProcess.stderr.on('data', (data) => {
-    console.error(`Python stderr: ${data.toString()}`);
-  });
-
-  pythonProcess.on('close', (code) => {
-    console.log(`Python streaming process exited with code ${code}`);
+  const broadcast = (message) => {
     wss.clients.forEach(client => {
       if (client.readyState === WebSocket.OPEN) {
-        client.send(JSON.stringify({ type: 'stream-finished' }));
+        client.send(JSON.stringify(message));
       }
     });
-  });
-
-  pythonProcess.on('error', (err) => {
-    console.error('Failed to start Python streaming process:', err);
-    wss.clients.forEach(client => {
-      if (client.readyState === WebSocket.OPEN) {
-        client.send(JSON.stringify({ type: 'stream-error', message: err.message }));
-      }
+  };
+
+  // Run the replay on a warm worker in streaming mode
+  backtestWorkers.request('stream', {
+    filepath: filePath,
+    params: {
+      atr_mult_sl: Number(atr_mult_sl || '1.094'), // Use default if not provided
+      atr_mult_trail: Number(atr_mult_trail || '4.093'), // Use default if not provided
+      rr_target: Number(rr_target || '3.990'), // Use default if not provided
+    },
+    // Batching / encoding of the event stream (see trading_system/streaming.py)
+    output: {
+      encoding: encoding || 'json',
+      // Without batch_bars, batch_ms alone sets the flush interval
+      batch_bars: batch_bars ? Number(batch_bars) : null,
+      batch_ms: batch_ms ? Number(batch_ms) : null,
+      max_fps: max_fps ? Number(max_fps) : null,
+      // Periodic {"type": "stats"} events with bars/sec and per-bar latency
+      stats_ms: stats_ms ? Number(stats_ms) : null,
+    },
+  }, broadcast)
+    .then(() => {
+      console.log('Python streaming request finished');
+      broadcast({ type: 'stream-finished' });
+    })
+    .catch((err) => {
+      console.error('Python streaming request failed:', err);
+      broadcast({ type: 'stream-error', message: err.message });
     });
-  });
 
   res.send('Streaming initiated via Python process.');
 });
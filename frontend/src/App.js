@@ -6,6 +6,51 @@ import { Container, Row, Col, Navbar, Form, Button, Card, Table, Spinner, Alert,
 import { LineChart, Line, XAxis, YAxis, CartesianGrid, Tooltip, Legend, ResponsiveContainer } from 'recharts';
 import 'bootstrap/dist/css/bootstrap.min.css';
 
+// Expand a batched stream message ("json", "compact" or "struct" encoding) into price_update-shaped bars
+const STREAM_FIELDS = ['t', 'open', 'high', 'low', 'close', 'volume', 'equity'];
+
+function epochToTimestamp(seconds) {
+  return new Date(seconds * 1000).toISOString().slice(0, 19).replace('T', ' ');
+}
+
+function expandPriceBatch(data) {
+  if (data.bars) {
+    return data.bars;
+  }
+  let columns = data;
+  if (data.data) {
+    // Fixed-layout little-endian records: int64 epoch seconds followed by six float64 fields
+    const bytes = Uint8Array.from(atob(data.data), c => c.charCodeAt(0));
+    const view = new DataView(bytes.buffer);
+    const recordSize = 8 + 8 * (STREAM_FIELDS.length - 1);
+    columns = Object.fromEntries(STREAM_FIELDS.map(field => [field, []]));
+    for (let i = 0; i < data.count; i++) {
+      const offset = i * recordSize;
+      columns.t.push(Number(view.getBigInt64(offset, true)));
+      STREAM_FIELDS.slice(1).forEach((field, k) => columns[field].push(view.getFloat64(offset + 8 + 8 * k, true)));
+    }
+  }
+  return columns.t.map((t, i) => ({
+    type: 'price_update',
+    timestamp: epochToTimestamp(t),
+    open: columns.open[i],
+    high: columns.high[i],
+    low: columns.low[i],
+    close: columns.close[i],
+    volume: columns.volume[i],
+    equity: columns.equity[i],
+  }));
+}
+
+function toTradeRow(tradeEvent) {
+  return {
+    time: tradeEvent.entry_time || tradeEvent.exit_time,
+    type: tradeEvent.direction,
+    price: tradeEvent.entry_price || tradeEvent.exit_price,
+    pnl: tradeEvent.pnl !== undefined ? tradeEvent.pnl.toFixed(2) : 'N/A'
+  };
+}
+
 // New component for Trades Table
 function TradesTable({ trades }) {
   const [currentPage, setCurrentPage] = useState(1);
@@ -80,8 +125,15 @@ function TradesTable({ trades }) {
   );
 }
 
+// Metrics can be null (e.g. Sharpe with fewer than two days of data)
+const formatMetric = (value, digits = 2) => (value === null || value === undefined ? 'n/a' : value.toFixed(digits));
+
 // New component for Performance Charts
 function PerformanceCharts({ results }) {
+  const metrics = results.metrics;
+  // Downsampled curves carry the position of every kept point in the full curve
+  const equityIndex = results.equity_curve_index;
+  const equityData = results.equity_curve.map((value, index) => ({name: equityIndex ? equityIndex[index] : index, equity: value}));
   return (
     <div>
       <h5 className="mb-3">Performance Metrics</h5>
@@ -111,12 +163,40 @@ function PerformanceCharts({ results }) {
             <td>Average PnL</td>
             <td>${results.avg_pnl.toFixed(2)}</td>
           </tr>
+          {metrics && (
+            <>
+              <tr>
+                <td>Max Drawdown</td>
+                <td>{formatMetric(metrics.max_drawdown_pct)}% (${formatMetric(metrics.max_drawdown)})</td>
+              </tr>
+              <tr>
+                <td>Sharpe / Sortino</td>
+                <td>{formatMetric(metrics.sharpe)} / {formatMetric(metrics.sortino)}</td>
+              </tr>
+              <tr>
+                <td>Profit Factor</td>
+                <td>{formatMetric(metrics.profit_factor)}</td>
+              </tr>
+              <tr>
+                <td>Expectancy</td>
+                <td>${formatMetric(metrics.expectancy)}</td>
+              </tr>
+              <tr>
+                <td>Exposure</td>
+                <td>{formatMetric(metrics.exposure_pct)}%</td>
+              </tr>
+              <tr>
+                <td>Median Trade Duration</td>
+                <td>{formatMetric(metrics.duration_minutes.median, 0)} min</td>
+              </tr>
+            </>
+          )}
         </tbody>
       </Table>
 
       <h5 className="mb-3">Equity Curve</h5>
       <ResponsiveContainer width="100%" height={300}>
-        <LineChart data={results.equity_curve.map((value, index) => ({name: index, equity: value}))}>
+        <LineChart data={equityData}>
           <CartesianGrid strokeDasharray="3 3" />
           <XAxis dataKey="name" />
           <YAxis />
@@ -184,7 +264,8 @@ function App() {
       newWs.onopen = () => {
         console.log('WebSocket connected');
         // Start streaming data from backend
-        axios.get(`http://localhost:3001/stream-data?filename=${streamFilename}`)
+        // Compact batches capped at 30 frames per second; trade events are always delivered
+        axios.get(`http://localhost:3001/stream-data?filename=${streamFilename}&encoding=compact&max_fps=30`)
           .then(response => console.log(response.data))
           .catch(err => console.error('Error starting stream:', err));
       };
@@ -199,12 +280,13 @@ function App() {
           setStreamedData(prevData => [...prevData, data]);
           console.log('Received price update:', data);
           if (data.trade_event) {
-            setStreamedTrades(prevTrades => [...prevTrades, {
-              time: data.trade_event.entry_time || data.trade_event.exit_time,
-              type: data.trade_event.direction,
-              price: data.trade_event.entry_price || data.trade_event.exit_price,
-              pnl: data.trade_event.pnl !== undefined ? data.trade_event.pnl.toFixed(2) : 'N/A'
-            }]);
+            setStreamedTrades(prevTrades => [...prevTrades, toTradeRow(data.trade_event)]);
+          }
+        } else if (data.type === 'price_batch') {
+          const bars = expandPriceBatch(data);
+          setStreamedData(prevData => [...prevData, ...bars]);
+          if (data.trade_events) {
+            setStreamedTrades(prevTrades => [...prevTrades, ...data.trade_events.map(toTradeRow)]);
           }
         } else if (data.type === 'stream-error') {
           console.error('Stream error:', data.message);
@@ -4,190 +4,196 @@ import os
 import numpy as np
 import json
 import argparse
-
-def run_backtest(df, initial_capital, risk_pct, atr_mult_sl, atr_mult_trail, rr_target, unit_value, partial_exit, partial_exit_pct):
-    trades = []
-    equity = initial_capital
-    equity_curve = [initial_capital]
-    position = None
-    highest_since_entry = 0
-    lowest_since_entry = 0
-
-    for i in range(1, len(df)):
-        row = df.iloc[i]
-        
-        if position is None:
-            if row['long_signal']:
-                sl_dist = row['ATR_14'] * atr_mult_sl
-                if sl_dist == 0: continue
-                tp_dist = sl_dist * rr_target
-                stop_loss = row['close'] - sl_dist
-                take_profit = row['close'] + tp_dist
-                
-                max_risk_amount = equity * risk_pct
-                qty = np.floor(max_risk_amount / (sl_dist * unit_value))
-
-                if qty > 0:
-                    position = {'type': 'long', 'entry_price': row['close'], 'stop_loss': stop_loss, 'take_profit': take_profit, 'quantity': qty, 'entry_time': row.name.strftime('%Y-%m-%d %H:%M:%S')}
-                    highest_since_entry = row['high']
-            
-            elif row['short_signal']:
-                sl_dist = row['ATR_14'] * atr_mult_sl
-                if sl_dist == 0: continue
-                tp_dist = sl_dist * rr_target
-                stop_loss = row['close'] + sl_dist
-                take_profit = row['close'] - tp_dist
-
-                max_risk_amount = equity * risk_pct
-                qty = np.floor(max_risk_amount / (sl_dist * unit_value))
-
-                if qty > 0:
-                    position = {'type': 'short', 'entry_price': row['close'], 'stop_loss': stop_loss, 'take_profit': take_profit, 'quantity': qty, 'entry_time': row.name.strftime('%Y-%m-%d %H:%M:%S')}
-                    lowest_since_entry = row['low']
-
-        elif position is not None:
-            if position['type'] == 'long':
-                if partial_exit and not position.get('partial_exited', False):
-                    partial_tp_price = position['entry_price'] + (position['take_profit'] - position['entry_price']) * 0.5
-                    if row['high'] >= partial_tp_price:
-                        partial_qty = position['quantity'] * partial_exit_pct
-                        pnl = (partial_tp_price - position['entry_price']) * partial_qty * unit_value
-                        equity += pnl
-                        trades.append({'entry_time': position['entry_time'], 'exit_time': row.name.strftime('%Y-%m-%d %H:%M:%S'), 'pnl': pnl, 'type': 'long_partial'})
-                        position['quantity'] -= partial_qty
-                        position['partial_exited'] = True
-
-                highest_since_entry = max(highest_since_entry, row['high'])
-                trail_stop_price = highest_since_entry - row['ATR_14'] * atr_mult_trail
-                position['stop_loss'] = max(position['stop_loss'], trail_stop_price)
-
-                if row['low'] <= position['stop_loss']:
-                    pnl = (position['stop_loss'] - position['entry_price']) * position['quantity'] * unit_value
-                    equity += pnl
-                    trades.append({'entry_time': position['entry_time'], 'exit_time': row.name.strftime('%Y-%m-%d %H:%M:%S'), 'pnl': pnl, 'type': 'long'})
-                    position = None
-                elif row['high'] >= position['take_profit']:
-                    pnl = (position['take_profit'] - position['entry_price']) * position['quantity'] * unit_value
-                    equity += pnl
-                    trades.append({'entry_time': position['entry_time'], 'exit_time': row.name.strftime('%Y-%m-%d %H:%M:%S'), 'pnl': pnl, 'type': 'long'})
-                    position = None
-            
-            elif position['type'] == 'short':
-                if partial_exit and not position.get('partial_exited', False):
-                    partial_tp_price = position['entry_price'] - (position['entry_price'] - position['take_profit']) * 0.5
-                    if row['low'] <= partial_tp_price:
-                        partial_qty = position['quantity'] * partial_exit_pct
-                        pnl = (position['entry_price'] - partial_tp_price) * partial_qty * unit_value
-                        equity += pnl
-                        trades.append({'entry_time': position['entry_time'], 'exit_time': row.name.strftime('%Y-%m-%d %H:%M:%S'), 'pnl': pnl, 'type': 'short_partial'})
-                        position['quantity'] -= partial_qty
-                        position['partial_exited'] = True
-
-                lowest_since_entry = min(lowest_since_entry, row['low'])
-                trail_stop_price = lowest_since_entry + row['ATR_14'] * atr_mult_trail
-                position['stop_loss'] = min(position['stop_loss'], trail_stop_price)
-
-                if row['high'] >= position['stop_loss']:
-                    pnl = (position['entry_price'] - position['stop_loss']) * position['quantity'] * unit_value
-                    equity += pnl
-                    trades.append({'entry_time': position['entry_time'], 'exit_time': row.name.strftime('%Y-%m-%d %H:%M:%S'), 'pnl': pnl, 'type': 'short'})
-                    position = None
-                elif row['low'] <= position['take_profit']:
-                    pnl = (position['entry_price'] - position['take_profit']) * position['quantity'] * unit_value
-                    equity += pnl
-                    trades.append({'entry_time': position['entry_time'], 'exit_time': row.name.strftime('%Y-%m-%d %H:%M:%S'), 'pnl': pnl, 'type': 'short'})
-                    position = None
-        
-        equity_curve.append(equity)
-
-    results = {
-        "final_equity": equity,
-        "total_trades": len(trades),
-        "wins": len([t for t in trades if t['pnl'] > 0]),
-        "losses": len([t for t in trades if t['pnl'] <= 0]),
-        "win_rate": (len([t for t in trades if t['pnl'] > 0]) / len(trades) * 100) if len(trades) > 0 else 0,
-        "avg_pnl": np.mean([t['pnl'] for t in trades]) if len(trades) > 0 else 0,
-        "trades": trades,
-        "equity_curve": equity_curve
-    }
-    return results
-
-def define_strategy(df_slice):
+import atexit
+from functools import partial
+from engine import run_backtest_reference, run_bar_engine
+from indicators import (CODE_RANGE_HIGH_VOL, CODE_RANGE_LOW_VOL, CODE_TREND_DOWN, CODE_TREND_UP, CODE_UNKNOWN,
+                        REGIMES, IncrementalStrategy, index_to_ns)
+from chunked import DEFAULT_CHUNK_BARS, run_chunked_backtest
+from datacache import DEFAULT_CACHE_DIR, file_digest, invalidate_file, load_ohlcv
+from portfolio import prepare_symbols, run_portfolio
+from ticks import DEFAULT_BAR_PERIOD, DEFAULT_TICK_CHUNK, load_ticks, run_tick_backtest
+from profiler import dumps_with_timings, profiling, stage, start_profiling, stop_profiling
+from signalstore import DEFAULT_MAX_BYTES, DEFAULT_STORE_DIR, load_or_compute, store_key
+from sweep import SWEEP_METRICS, SWEEP_PARAMS, parse_grid, run_sweep
+from walkforward import WALK_FORWARD_MODES, run_walk_forward
+from streaming import STREAM_ENCODINGS, StreamWriter, format_time
+from worker import LRUCache, serve
+
+def run_backtest(df, initial_capital, risk_pct, atr_mult_sl, atr_mult_trail, rr_target, unit_value, partial_exit, partial_exit_pct,
+                 equity_points=None, equity_file=None):
+    # Array-backed engine (engine.py); run_backtest_reference is the original row loop it must match.
+    # equity_points / equity_file: compact LTTB equity curve and the full curve as a binary side file (metrics.py)
+    return run_bar_engine(df, initial_capital, risk_pct, atr_mult_sl, atr_mult_trail, rr_target, unit_value, partial_exit, partial_exit_pct,
+                          equity_points, equity_file)
+
+# Fixed backtest parameters (not exposed on the command line) and the argument order of run_backtest / stream_backtest
+DEFAULT_PARAMS = {'initial_capital': 1000, 'risk_pct': 0.005, 'unit_value': 1.0, 'partial_exit': True, 'partial_exit_pct': 0.5}
+BACKTEST_ARGS = ['initial_capital', 'risk_pct', 'atr_mult_sl', 'atr_mult_trail', 'rr_target', 'unit_value', 'partial_exit', 'partial_exit_pct']
+
+# Indicator settings define_strategy is built from; part of the signal store key (signalstore.store_key).
+# The column names (ATR_14, SMA_20, ...) stay fixed, the engine and the signal rules refer to them.
+STRATEGY_CONFIG = {
+    'atr': 14, 'rsi': 14, 'sma_fast': 20, 'sma_slow': 50,
+    'regime_timeframe': '60min', 'regime_sma': 50, 'bbands': [20, 2], 'bb_width_sma': 50,
+    'patterns': ['engulfing', 'hammer'],
+}
+
+def classify_regime(df_60m):
+    # Vectorized regime code per 60-minute bar (NaN comparisons are False, as in the row-wise version)
+    sma50 = df_60m['sma50'].to_numpy(dtype=np.float64)
+    sma50_prev = df_60m['sma50_prev'].to_numpy(dtype=np.float64)
+    bb_width = df_60m['bb_width'].to_numpy(dtype=np.float64)
+    bb_width_sma50 = df_60m['bb_width_sma50'].to_numpy(dtype=np.float64)
+    codes = np.where(bb_width > bb_width_sma50, CODE_RANGE_HIGH_VOL, CODE_RANGE_LOW_VOL)
+    codes = np.where(sma50 < sma50_prev, CODE_TREND_DOWN, codes)
+    codes = np.where(sma50 > sma50_prev, CODE_TREND_UP, codes)
+    return codes.astype(np.int8)
+
+def regime_to_bars(hour_index, hour_codes, bar_index):
+    # Forward-fill hourly codes onto the bar index; bars before the first hour get -1 (missing)
+    positions = np.searchsorted(hour_index.values, bar_index.values, side='right') - 1
+    return np.where(positions >= 0, hour_codes[np.maximum(positions, 0)], -1).astype(np.int8)
+
+def add_indicators(df_slice, config=STRATEGY_CONFIG):
     # Calculate technical indicators
-    df_slice.ta.atr(length=14, append=True, col_names='ATR_14')
-    df_slice.ta.rsi(length=14, append=True, col_names='RSI_14')
-    df_slice.ta.sma(length=20, append=True, col_names='SMA_20')
-    df_slice.ta.sma(length=50, append=True, col_names='SMA_50')
+    df_slice.ta.atr(length=config['atr'], append=True, col_names='ATR_14')
+    df_slice.ta.rsi(length=config['rsi'], append=True, col_names='RSI_14')
+    df_slice.ta.sma(length=config['sma_fast'], append=True, col_names='SMA_20')
+    df_slice.ta.sma(length=config['sma_slow'], append=True, col_names='SMA_50')
+    return df_slice
 
+def add_regime(df_slice, config=STRATEGY_CONFIG):
     # Regime Detection (requires enough data for 60m resampling)
+    regime_codes = np.full(len(df_slice), CODE_UNKNOWN, dtype=np.int8) # Default if 60m data is not enough
     if len(df_slice) >= 60: # Ensure enough data for 60-minute resampling
         ohlc_dict = {'open':'first', 'high':'max', 'low':'min', 'close':'last', 'volume':'sum'}
-        df_60m = df_slice.resample('60min').apply(ohlc_dict).dropna()
+        df_60m = df_slice.resample(config['regime_timeframe']).apply(ohlc_dict).dropna()
         if not df_60m.empty:
-            df_60m['sma50'] = ta.sma(df_60m['close'], length=50)
+            df_60m['sma50'] = ta.sma(df_60m['close'], length=config['regime_sma'])
             df_60m['sma50_prev'] = df_60m['sma50'].shift(1)
-            bbands = ta.bbands(df_60m['close'], length=20, std=2)
-            df_60m['bb_width'] = bbands['BBB_20_2.0']
-            df_60m['bb_width_sma50'] = ta.sma(df_60m['bb_width'], length=50)
-            def get_regime(row):
-                if row['sma50'] > row['sma50_prev']: return "TREND_UP"
-                elif row['sma50'] < row['sma50_prev']: return "TREND_DOWN"
-                else: return "RANGE_HIGH_VOL" if row['bb_width'] > row['bb_width_sma50'] else "RANGE_LOW_VOL"
-            df_60m['regime'] = df_60m.apply(get_regime, axis=1)
-            df_slice['regime'] = df_60m['regime'].reindex(df_slice.index, method='ffill')
-        else:
-            df_slice['regime'] = "UNKNOWN" # Default if 60m data is not enough
-    else:
-        df_slice['regime'] = "UNKNOWN" # Default if 60m data is not enough
-
+            bb_length, bb_std = config['bbands']
+            bbands = ta.bbands(df_60m['close'], length=bb_length, std=bb_std)
+            df_60m['bb_width'] = bbands[f'BBB_{bb_length}_{float(bb_std)}']
+            df_60m['bb_width_sma50'] = ta.sma(df_60m['bb_width'], length=config['bb_width_sma'])
+            regime_codes = regime_to_bars(df_60m.index, classify_regime(df_60m), df_slice.index)
+    df_slice['regime'] = pd.Categorical.from_codes(regime_codes, categories=REGIMES)
+    return df_slice
 
+def add_signals(df_slice, config=STRATEGY_CONFIG):
     # Signal Generation
-    df_slice.ta.cdl_pattern(name=["engulfing", "hammer"], append=True)
+    regime_codes = df_slice['regime'].cat.codes.to_numpy()
+    df_slice.ta.cdl_pattern(name=list(config['patterns']), append=True)
     long_candle_signal = (df_slice['CDL_ENGULFING'] > 0) | (df_slice['CDL_HAMMER'] > 0)
     short_candle_signal = (df_slice['CDL_ENGULFING'] < 0)
     ma_slope_up = df_slice['SMA_20'] > df_slice['SMA_50']
     ma_slope_down = df_slice['SMA_20'] < df_slice['SMA_50']
-    df_slice['long_signal'] = long_candle_signal & (df_slice['regime'] != "TREND_DOWN") & ma_slope_up
-    df_slice['short_signal'] = short_candle_signal & (df_slice['regime'] != "TREND_UP") & ma_slope_down
-    
+    df_slice['long_signal'] = long_candle_signal & (regime_codes != CODE_TREND_DOWN) & ma_slope_up
+    df_slice['short_signal'] = short_candle_signal & (regime_codes != CODE_TREND_UP) & ma_slope_down
     return df_slice
 
-def stream_backtest(df, initial_capital, risk_pct, atr_mult_sl, atr_mult_trail, rr_target, unit_value, partial_exit, partial_exit_pct):
+def define_strategy(df_slice, config=STRATEGY_CONFIG):
+    # Stages are separate functions so benchmarks/ can time them one by one
+    with stage('indicators'):
+        df_slice = add_indicators(df_slice, config)
+    with stage('regime'):
+        df_slice = add_regime(df_slice, config)
+    with stage('signals'):
+        return add_signals(df_slice, config)
+
+def prepare_strategy(df, use_store=True, store_dir=DEFAULT_STORE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+    # define_strategy output, reloaded from the signal store when this data was seen before
+    if not use_store:
+        return define_strategy(df.copy())
+    return load_or_compute(df, lambda: define_strategy(df.copy()), STRATEGY_CONFIG, store_dir, max_bytes)
+
+def load_strategy(filepath, use_cache=True, cache_dir=DEFAULT_CACHE_DIR, use_store=True, store_dir=DEFAULT_STORE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+    return prepare_strategy(load_ohlcv(filepath, use_cache=use_cache, cache_dir=cache_dir), use_store, store_dir, max_bytes)
+
+def resolve_params(overrides):
+    # Positional run_backtest arguments from DEFAULT_PARAMS plus per-request overrides
+    params = dict(DEFAULT_PARAMS)
+    params.update(overrides)
+    if params.get('atr_mult_tp') is not None:
+        params['rr_target'] = params['atr_mult_tp'] / params['atr_mult_sl']
+    missing = [name for name in BACKTEST_ARGS if params.get(name) is None]
+    if missing:
+        raise ValueError('missing parameters: ' + ', '.join(missing))
+    return [params[name] for name in BACKTEST_ARGS]
+
+def make_server_handlers(cache_dir=DEFAULT_CACHE_DIR, use_store=True, store_dir=DEFAULT_STORE_DIR, max_bytes=DEFAULT_MAX_BYTES, max_datasets=4):
+    # Request handlers for --serve; loaded datasets and computed strategies stay in memory between requests
+    datasets = LRUCache(max_datasets)
+    strategies = LRUCache(max_datasets)
+
+    def load(request):
+        filepath = request['filepath']
+        use_cache = request.get('use_cache', True)
+        if use_cache:
+            stat = os.stat(filepath)
+            key = (os.path.abspath(filepath), stat.st_size, stat.st_mtime_ns)
+        else:
+            # Uploads arrive under a new temporary path every time; keyed by content, a re-upload skips the parse
+            with stage('file_digest'):
+                key = file_digest(filepath)
+        return datasets.get(key, lambda: load_ohlcv(filepath, use_cache=use_cache, cache_dir=cache_dir))
+
+    def backtest(request, responder):
+        if request.get('profile'):
+            # Stages served from the in-memory caches simply do not show up in the timings
+            with profiling() as profiler:
+                results = run(request)
+            return {**results, "timings": profiler.report()}
+        return run(request)
+
+    def run(request):
+        df = load(request)
+        # Keyed by content, so re-uploads of the same data under a new path reuse the computed frame
+        df_strategy = strategies.get(store_key(df, STRATEGY_CONFIG), lambda: prepare_strategy(df, use_store, store_dir, max_bytes))
+        return run_backtest(df_strategy, *resolve_params(request.get('params', {})), equity_points=request.get('equity_points'))
+
+    def stream(request, responder):
+        stream_backtest(load(request), *resolve_params(request.get('params', {})), emit=responder.event_line, output=request.get('output'))
+        return {"finished": True}
+
+    def clear(request, responder):
+        datasets.clear()
+        strategies.clear()
+        return {"cleared": True}
+
+    return {'backtest': backtest, 'stream': stream, 'clear': clear}
+
+def check_engine_parity(df_strategy, *params):
+    # Run the array engine and the reference df.iloc loop on the same frame and compare the results dicts
+    expected = run_backtest_reference(df_strategy, *params)
+    actual = run_backtest(df_strategy, *params)
+    mismatches = [key for key in expected if expected[key] != actual[key]]
+    return {"parity": not mismatches, "mismatched_keys": mismatches, "total_trades": expected["total_trades"]}
+
+def stream_backtest(df, initial_capital, risk_pct, atr_mult_sl, atr_mult_trail, rr_target, unit_value, partial_exit, partial_exit_pct, emit=print, output=None):
     trades = []
     equity = initial_capital
     position = None
     highest_since_entry = 0
     lowest_since_entry = 0
 
-    # Keep a rolling window of data for indicator calculation
-    # The size of this window should be at least the largest lookback period for any indicator
-    # For example, if SMA_50 is the largest, then window_size should be at least 50
-    window_size = 60 # For 60-minute regime detection, ensure enough data
+    # Indicators are updated incrementally, one bar at a time, instead of re-running define_strategy on a window
+    strategy = IncrementalStrategy()
+    bar_times = index_to_ns(df.index).tolist()
+    bar_columns = [df[c].to_numpy(dtype=np.float64).tolist() for c in ['open', 'high', 'low', 'close', 'volume']]
+    warmup_bars = 59 # Bars that only feed the indicator state before trading starts
+    # Batching / encoding / frame-rate options, see streaming.StreamWriter
+    writer = StreamWriter(emit, **(output or {}))
 
-    for i in range(len(df)):
-        current_bar = df.iloc[i]
-        
-        # Create a slice of data up to the current bar for indicator calculation
-        # Ensure enough data for indicators
-        if i < window_size - 1:
+    for i, (bar_time, *bar) in enumerate(zip(bar_times, *bar_columns)):
+        current_bar_with_signals = strategy.update(bar_time, *bar)
+        timestamp = format_time(bar_time)
+
+        if i < warmup_bars:
             # Not enough data for full indicator calculation yet, just send price
-            output_data = {
-                "type": "price_update",
-                "timestamp": current_bar.name.strftime('%Y-%m-%d %H:%M:%S'),
-                "open": current_bar['open'],
-                "high": current_bar['high'],
-                "low": current_bar['low'],
-                "close": current_bar['close'],
-                "volume": current_bar['volume'],
-                "equity": equity
-            }
-            print(json.dumps(output_data))
+            writer.bar(bar_time, timestamp, *bar, equity)
             continue
 
-        df_slice = df.iloc[max(0, i - window_size + 1):i+1].copy()
-        df_slice = define_strategy(df_slice)
-        current_bar_with_signals = df_slice.iloc[-1]
-
         trade_event = None
 
         if position is None:
@@ -202,7 +208,7 @@ def stream_backtest(df, initial_capital, risk_pct, atr_mult_sl, atr_mult_trail,
                 qty = np.floor(max_risk_amount / (sl_dist * unit_value))
 
                 if qty > 0:
-                    position = {'type': 'long', 'entry_price': current_bar_with_signals['close'], 'stop_loss': stop_loss, 'take_profit': take_profit, 'quantity': qty, 'entry_time': current_bar_with_signals.name.strftime('%Y-%m-%d %H:%M:%S')}
+                    position = {'type': 'long', 'entry_price': current_bar_with_signals['close'], 'stop_loss': stop_loss, 'take_profit': take_profit, 'quantity': qty, 'entry_time': timestamp}
                     highest_since_entry = current_bar_with_signals['high']
                     trade_event = {
                         "type": "trade_entry",
@@ -223,7 +229,7 @@ def stream_backtest(df, initial_capital, risk_pct, atr_mult_sl, atr_mult_trail,
                 qty = np.floor(max_risk_amount / (sl_dist * unit_value))
 
                 if qty > 0:
-                    position = {'type': 'short', 'entry_price': current_bar_with_signals['close'], 'stop_loss': stop_loss, 'take_profit': take_profit, 'quantity': qty, 'entry_time': current_bar_with_signals.name.strftime('%Y-%m-%d %H:%M:%S')}
+                    position = {'type': 'short', 'entry_price': current_bar_with_signals['close'], 'stop_loss': stop_loss, 'take_profit': take_profit, 'quantity': qty, 'entry_time': timestamp}
                     lowest_since_entry = current_bar_with_signals['low']
                     trade_event = {
                         "type": "trade_entry",
@@ -241,13 +247,13 @@ def stream_backtest(df, initial_capital, risk_pct, atr_mult_sl, atr_mult_trail,
                         partial_qty = position['quantity'] * partial_exit_pct
                         pnl = (partial_tp_price - position['entry_price']) * partial_qty * unit_value
                         equity += pnl
-                        trades.append({'entry_time': position['entry_time'], 'exit_time': current_bar_with_signals.name.strftime('%Y-%m-%d %H:%M:%S'), 'pnl': pnl, 'type': 'long_partial'})
+                        trades.append({'entry_time': position['entry_time'], 'exit_time': timestamp, 'pnl': pnl, 'type': 'long_partial'})
                         position['quantity'] -= partial_qty
                         position['partial_exited'] = True
                         trade_event = {
                             "type": "trade_exit",
                             "direction": "long_partial",
-                            "exit_time": current_bar_with_signals.name.strftime('%Y-%m-%d %H:%M:%S'),
+                            "exit_time": timestamp,
                             "exit_price": partial_tp_price,
                             "pnl": pnl
                         }
@@ -259,11 +265,11 @@ def stream_backtest(df, initial_capital, risk_pct, atr_mult_sl, atr_mult_trail,
                 if current_bar_with_signals['low'] <= position['stop_loss']:
                     pnl = (position['stop_loss'] - position['entry_price']) * position['quantity'] * unit_value
                     equity += pnl
-                    trades.append({'entry_time': position['entry_time'], 'exit_time': current_bar_with_signals.name.strftime('%Y-%m-%d %H:%M:%S'), 'pnl': pnl, 'type': 'long'})
+                    trades.append({'entry_time': position['entry_time'], 'exit_time': timestamp, 'pnl': pnl, 'type': 'long'})
                     trade_event = {
                         "type": "trade_exit",
                         "direction": "long",
-                        "exit_time": current_bar_with_signals.name.strftime('%Y-%m-%d %H:%M:%S'),
+                        "exit_time": timestamp,
                         "exit_price": position['stop_loss'],
                         "pnl": pnl
                     }
@@ -271,11 +277,11 @@ def stream_backtest(df, initial_capital, risk_pct, atr_mult_sl, atr_mult_trail,
                 elif current_bar_with_signals['high'] >= position['take_profit']:
                     pnl = (position['take_profit'] - position['entry_price']) * position['quantity'] * unit_value
                     equity += pnl
-                    trades.append({'entry_time': position['entry_time'], 'exit_time': current_bar_with_signals.name.strftime('%Y-%m-%d %H:%M:%S'), 'pnl': pnl, 'type': 'long'})
+                    trades.append({'entry_time': position['entry_time'], 'exit_time': timestamp, 'pnl': pnl, 'type': 'long'})
                     trade_event = {
                         "type": "trade_exit",
                         "direction": "long",
-                        "exit_time": current_bar_with_signals.name.strftime('%Y-%m-%d %H:%M:%S'),
+                        "exit_time": timestamp,
                         "exit_price": position['take_profit'],
                         "pnl": pnl
                     }
@@ -288,13 +294,13 @@ def stream_backtest(df, initial_capital, risk_pct, atr_mult_sl, atr_mult_trail,
                         partial_qty = position['quantity'] * partial_exit_pct
                         pnl = (position['entry_price'] - partial_tp_price) * partial_qty * unit_value
                         equity += pnl
-                        trades.append({'entry_time': position['entry_time'], 'exit_time': current_bar_with_signals.name.strftime('%Y-%m-%d %H:%M:%S'), 'pnl': pnl, 'type': 'short_partial'})
+                        trades.append({'entry_time': position['entry_time'], 'exit_time': timestamp, 'pnl': pnl, 'type': 'short_partial'})
                         position['quantity'] -= partial_qty
                         position['partial_exited'] = True
                         trade_event = {
                             "type": "trade_exit",
                             "direction": "short_partial",
-                            "exit_time": current_bar_with_signals.name.strftime('%Y-%m-%d %H:%M:%S'),
+                            "exit_time": timestamp,
                             "exit_price": partial_tp_price,
                             "pnl": pnl
                         }
@@ -306,11 +312,11 @@ def stream_backtest(df, initial_capital, risk_pct, atr_mult_sl, atr_mult_trail,
                 if current_bar_with_signals['high'] >= position['stop_loss']:
                     pnl = (position['entry_price'] - position['stop_loss']) * position['quantity'] * unit_value
                     equity += pnl
-                    trades.append({'entry_time': position['entry_time'], 'exit_time': current_bar_with_signals.name.strftime('%Y-%m-%d %H:%M:%S'), 'pnl': pnl, 'type': 'short'})
+                    trades.append({'entry_time': position['entry_time'], 'exit_time': timestamp, 'pnl': pnl, 'type': 'short'})
                     trade_event = {
                         "type": "trade_exit",
                         "direction": "short",
-                        "exit_time": current_bar_with_signals.name.strftime('%Y-%m-%d %H:%M:%S'),
+                        "exit_time": timestamp,
                         "exit_price": position['stop_loss'],
                         "pnl": pnl
                     }
@@ -318,64 +324,182 @@ def stream_backtest(df, initial_capital, risk_pct, atr_mult_sl, atr_mult_trail,
                 elif current_bar_with_signals['low'] <= position['take_profit']:
                     pnl = (position['entry_price'] - position['take_profit']) * position['quantity'] * unit_value
                     equity += pnl
-                    trades.append({'entry_time': position['entry_time'], 'exit_time': current_bar_with_signals.name.strftime('%Y-%m-%d %H:%M:%S'), 'pnl': pnl, 'type': 'short'})
+                    trades.append({'entry_time': position['entry_time'], 'exit_time': timestamp, 'pnl': pnl, 'type': 'short'})
                     trade_event = {
                         "type": "trade_exit",
                         "direction": "short",
-                        "exit_time": current_bar_with_signals.name.strftime('%Y-%m-%d %H:%M:%S'),
+                        "exit_time": timestamp,
                         "exit_price": position['take_profit'],
                         "pnl": pnl
                     }
                     position = None
         
-        output_data = {
-            "type": "price_update",
-            "timestamp": current_bar_with_signals.name.strftime('%Y-%m-%d %H:%M:%S'),
-            "open": current_bar_with_signals['open'],
-            "high": current_bar_with_signals['high'],
-            "low": current_bar_with_signals['low'],
-            "close": current_bar_with_signals['close'],
-            "volume": current_bar_with_signals['volume'],
-            "equity": equity
-        }
-        if trade_event:
-            output_data["trade_event"] = trade_event
-        
-        print(json.dumps(output_data))
+        writer.bar(bar_time, timestamp, *bar, equity, trade_event)
+
+    writer.close()
 
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
-    parser.add_argument('--filepath', required=True)
-    parser.add_argument('--atr_mult_sl', type=float, required=True)
-    parser.add_argument('--atr_mult_trail', type=float, required=True)
-    parser.add_argument('--rr_target', type=float, required=True)
+    parser.add_argument('--filepath')
+    parser.add_argument('--atr_mult_sl', type=float)
+    parser.add_argument('--atr_mult_trail', type=float)
+    parser.add_argument('--rr_target', type=float)
     parser.add_argument('--atr_mult_tp', type=float, default=None, help='ATR multiplier for take profit. Overrides rr_target.')
     parser.add_argument('--stream', action='store_true', help='Enable streaming mode for real-time visualization.')
+    parser.add_argument('--check_parity', action='store_true', help='Compare the array engine against the reference row loop and exit.')
+    parser.add_argument('--sweep', action='store_true', help='Evaluate a parameter grid in parallel instead of a single backtest.')
+    for name in SWEEP_PARAMS:
+        parser.add_argument(f'--grid_{name}', default=None, help=f'Sweep values for {name}: "start:stop:step" or "a,b,c".')
+    parser.add_argument('--walk_forward', choices=WALK_FORWARD_MODES, default=None, help='Sweep the grid on each train window and evaluate the winner on the following test window.')
+    parser.add_argument('--train_period', default='30D', help='Train window length for --walk_forward (pandas Timedelta, e.g. "30D").')
+    parser.add_argument('--test_period', default='7D', help='Test window length and fold step for --walk_forward.')
+    parser.add_argument('--sweep_metric', choices=SWEEP_METRICS, default='final_equity', help='Metric used to rank sweep results.')
+    parser.add_argument('--sweep_top', type=int, default=20, help='Number of best combinations in the sweep summary.')
+    parser.add_argument('--workers', type=int, default=None, help='Worker processes for the sweep / walk-forward folds / per-symbol indicators (default: all cores).')
+    parser.add_argument('--no_cache', action='store_true', help='Parse the text file directly, bypassing the binary data cache.')
+    parser.add_argument('--build_cache', action='store_true', help='(Re)build the binary cache for --filepath and exit.')
+    parser.add_argument('--clear_cache', action='store_true', help='Remove cached data for --filepath and exit.')
+    parser.add_argument('--cache_dir', default=DEFAULT_CACHE_DIR, help='Directory holding the binary data cache.')
+    parser.add_argument('--no_signal_store', action='store_true', help='Always recompute indicators instead of using the signal store.')
+    parser.add_argument('--signal_store_dir', default=DEFAULT_STORE_DIR, help='Directory holding stored indicator / signal columns.')
+    parser.add_argument('--signal_store_mb', type=float, default=DEFAULT_MAX_BYTES / 1024 ** 2, help='Size limit of the signal store; least recently used entries are evicted.')
+    parser.add_argument('--stream_encoding', choices=STREAM_ENCODINGS, default='json', help='Encoding of --stream output.')
+    parser.add_argument('--batch_bars', type=int, default=None, help='Bars per --stream message (default: 1, or no limit with --batch_ms).')
+    parser.add_argument('--batch_ms', type=float, default=None, help='Flush --stream output at least this often (milliseconds).')
+    parser.add_argument('--max_fps', type=float, default=None, help='Cap --stream messages per second; price bars in between are merged, trade events are kept.')
+    parser.add_argument('--serve', action='store_true', help='Run as a long-lived worker answering JSON-lines requests on stdin.')
+    parser.add_argument('--chunked', action='store_true', help='Out-of-core backtest: read --filepath in chunks and write trades / equity curve to --output_dir.')
+    parser.add_argument('--chunk_bars', type=int, default=DEFAULT_CHUNK_BARS, help='Bars read per chunk with --chunked.')
+    parser.add_argument('--symbol', nargs=3, action='append', metavar=('NAME', 'FILEPATH', 'UNIT_VALUE'),
+                        help='Portfolio mode: add an instrument file with its unit value. Repeat for every symbol; --filepath is not used.')
+    parser.add_argument('--profile', action='store_true', help='Time every stage and count its allocations; adds "timings" to the results, "stats" events to --stream.')
+    parser.add_argument('--profile_pstats', default=None, help='Also run cProfile and write its stats to this file (read with pstats).')
+    parser.add_argument('--stats_ms', type=float, default=1000, help='Interval of --profile "stats" events in --stream mode (milliseconds).')
+    parser.add_argument('--equity_points', type=int, default=None, help='Downsample equity_curve to this many points (LTTB); adds equity_curve_index.')
+    parser.add_argument('--equity_file', default=None, help='Write the full equity curve to this file as raw float64.')
+    parser.add_argument('--output_dir', default='chunked_output', help='Directory for the --chunked trades and equity curve files.')
+    parser.add_argument('--ticks', action='store_true', help='--filepath holds ticks ("date time price volume"): build bars from them and fill exits tick by tick.')
+    parser.add_argument('--bar_period', default=DEFAULT_BAR_PERIOD, help='Bar length the --ticks file is aggregated to (pandas Timedelta, e.g. "1min").')
+    parser.add_argument('--tick_chunk', type=int, default=DEFAULT_TICK_CHUNK, help='Ticks read per chunk with --ticks.')
     args = parser.parse_args()
 
+    if args.serve:
+        serve(make_server_handlers(args.cache_dir, not args.no_signal_store, args.signal_store_dir, args.signal_store_mb * 1024 ** 2))
+        raise SystemExit(0)
+    if args.filepath is None and not args.symbol:
+        parser.error('--filepath is required')
+    if args.profile or args.profile_pstats:
+        # Stopped at exit, whichever branch below ends the run; that also writes the pstats file
+        start_profiling(allocations=args.profile, pstats_path=args.profile_pstats)
+        atexit.register(stop_profiling)
+
+    if (args.symbol or args.ticks) and (args.clear_cache or args.build_cache):
+        parser.error('--build_cache / --clear_cache take a single bar --filepath')
+    modes = [flag for flag, enabled in (('--sweep', args.sweep), ('--walk_forward', args.walk_forward), ('--stream', args.stream),
+                                        ('--check_parity', args.check_parity)) if enabled]
+    if len(modes) > 1:
+        parser.error(f'{" / ".join(modes)} cannot be combined')
+    if args.clear_cache or args.build_cache:
+        removed = invalidate_file(args.filepath, args.cache_dir)
+        if args.build_cache:
+            load_ohlcv(args.filepath, cache_dir=args.cache_dir)
+        print(json.dumps({"cache_entries_removed": removed, "cache_built": args.build_cache}))
+        raise SystemExit(0)
+
     # --- Parameters ---
-    initial_capital = 1000
-    risk_pct = 0.005
-    unit_value = 1.0
-    partial_exit = True
-    partial_exit_pct = 0.5
+    initial_capital = DEFAULT_PARAMS['initial_capital']
+    risk_pct = DEFAULT_PARAMS['risk_pct']
+    unit_value = DEFAULT_PARAMS['unit_value']
+    partial_exit = DEFAULT_PARAMS['partial_exit']
+    partial_exit_pct = DEFAULT_PARAMS['partial_exit_pct']
     max_drawdown_pct = 0.2
 
-    df = pd.read_csv(
-        args.filepath,
-        header=None,
-        sep=r'\s+',
-        names=['date', 'time', 'open', 'high', 'low', 'close', 'volume']
-    )
-    df['datetime'] = pd.to_datetime(df['date'] + ' ' + df['time'])
-    df.set_index('datetime', inplace=True)
-    df.drop(['date', 'time'], axis=1, inplace=True)
+    defaults = {'atr_mult_sl': args.atr_mult_sl, 'atr_mult_trail': args.atr_mult_trail, 'rr_target': args.rr_target, 'risk_pct': risk_pct, 'partial_exit_pct': partial_exit_pct}
+    if args.sweep or args.walk_forward:
+        if args.atr_mult_tp is not None:
+            # rr_target = atr_mult_tp / atr_mult_sl would differ per grid point; sweep --grid_rr_target instead
+            parser.error('--atr_mult_tp is not supported with --sweep / --walk_forward, use --grid_rr_target')
+        try:
+            grid = {name: parse_grid(getattr(args, f'grid_{name}')) if getattr(args, f'grid_{name}') else [defaults[name]] for name in SWEEP_PARAMS}
+        except ValueError as e:
+            parser.error(f'invalid grid: {e}')
+        missing = [name for name, values in grid.items() if values == [None]]
+    else:
+        missing = [name for name in ('atr_mult_sl', 'atr_mult_trail', 'rr_target') if defaults[name] is None]
+    if missing:
+        parser.error('missing values for: ' + ', '.join(missing))
+
+    # tp distance is sl_dist * rr_target with sl_dist = ATR * atr_mult_sl, so an ATR based TP maps onto rr_target
+    rr_target = args.atr_mult_tp / args.atr_mult_sl if args.atr_mult_tp is not None and args.atr_mult_sl else args.rr_target
+
+    if args.symbol:
+        if args.sweep or args.walk_forward or args.stream or args.check_parity or args.chunked or args.ticks:
+            parser.error('--symbol runs a single batch portfolio backtest')
+        symbols = [(name, float(unit)) for name, _, unit in args.symbol]
+        if len({name for name, _ in symbols}) != len(symbols):
+            parser.error('symbol names must be unique')
+        # Indicators per symbol in parallel, then one time-merged loop over all symbols with shared equity
+        load = partial(load_strategy, use_cache=not args.no_cache, cache_dir=args.cache_dir, use_store=not args.no_signal_store,
+                       store_dir=args.signal_store_dir, max_bytes=args.signal_store_mb * 1024 ** 2)
+        arrays = prepare_symbols([filepath for _, filepath, _ in args.symbol], load, workers=args.workers)
+        results = run_portfolio(symbols, arrays, initial_capital, risk_pct, args.atr_mult_sl, args.atr_mult_trail, rr_target, partial_exit, partial_exit_pct)
+        print(dumps_with_timings(results))
+        raise SystemExit(0)
+
+    if args.chunked:
+        if args.sweep or args.walk_forward or args.stream or args.check_parity or args.ticks:
+            parser.error('--chunked runs a single batch backtest')
+        # The whole file is never loaded, so neither the data cache nor the signal store is used
+        results = run_chunked_backtest(args.filepath, define_strategy, args.output_dir, initial_capital, risk_pct, args.atr_mult_sl,
+                                       args.atr_mult_trail, rr_target, unit_value, partial_exit, partial_exit_pct, args.chunk_bars)
+        print(dumps_with_timings(results))
+        raise SystemExit(0)
+
+    if args.ticks:
+        if args.sweep or args.walk_forward or args.stream or args.check_parity:
+            parser.error('--ticks runs a single batch backtest')
+        # Bars are rebuilt from the ticks on every run, so the data cache is not used; the signal store still is
+        df, tick_prices, tick_start = load_ticks(args.filepath, args.bar_period, args.tick_chunk)
+        df_strategy = prepare_strategy(df, not args.no_signal_store, args.signal_store_dir, args.signal_store_mb * 1024 ** 2)
+        results = run_tick_backtest(df_strategy, tick_prices, tick_start, initial_capital, risk_pct, args.atr_mult_sl, args.atr_mult_trail,
+                                    rr_target, unit_value, partial_exit, partial_exit_pct, equity_points=args.equity_points, equity_file=args.equity_file)
+        print(dumps_with_timings(results))
+        raise SystemExit(0)
+
+    df = load_ohlcv(args.filepath, use_cache=not args.no_cache, cache_dir=args.cache_dir)
+
+    if args.sweep:
+        # Indicators do not depend on the swept parameters, so they are computed once for the whole grid
+        df_strategy = prepare_strategy(df, not args.no_signal_store, args.signal_store_dir, args.signal_store_mb * 1024 ** 2)
+        with stage('sweep'):
+            summary = run_sweep(df_strategy, grid, initial_capital, unit_value, partial_exit, metric=args.sweep_metric, workers=args.workers, top=args.sweep_top)
+        print(dumps_with_timings(summary, indent=None))
+        raise SystemExit(0)
+
+    if args.walk_forward:
+        # Indicators once over the whole series; folds slice the arrays, so every window starts warmed up
+        df_strategy = prepare_strategy(df, not args.no_signal_store, args.signal_store_dir, args.signal_store_mb * 1024 ** 2)
+        with stage('walk_forward'):
+            summary = run_walk_forward(df_strategy, grid, initial_capital, unit_value, partial_exit, args.train_period, args.test_period,
+                                       mode=args.walk_forward, metric=args.sweep_metric, workers=args.workers)
+        print(dumps_with_timings(summary, indent=None))
+        raise SystemExit(0)
 
     if args.stream:
-        stream_backtest(df, initial_capital, risk_pct, args.atr_mult_sl, args.atr_mult_trail, args.rr_target, unit_value, partial_exit, partial_exit_pct, max_drawdown_pct, args.atr_mult_tp)
+        output = {'encoding': args.stream_encoding, 'batch_bars': args.batch_bars, 'batch_ms': args.batch_ms, 'max_fps': args.max_fps}
+        if args.profile:
+            output['stats_ms'] = args.stats_ms
+        with stage('stream'):
+            stream_backtest(df, initial_capital, risk_pct, args.atr_mult_sl, args.atr_mult_trail, rr_target, unit_value, partial_exit, partial_exit_pct, output=output)
+    elif args.check_parity:
+        df_strategy = prepare_strategy(df, not args.no_signal_store, args.signal_store_dir, args.signal_store_mb * 1024 ** 2)
+        parity = check_engine_parity(df_strategy, initial_capital, risk_pct, args.atr_mult_sl, args.atr_mult_trail, rr_target, unit_value, partial_exit, partial_exit_pct)
+        print(json.dumps(parity, indent=4))
+        raise SystemExit(0 if parity["parity"] else 1)
     else:
         # Apply strategy to the entire DataFrame for batch backtesting
-        df_strategy = define_strategy(df.copy())
-        results = run_backtest(df_strategy, initial_capital, risk_pct, args.atr_mult_sl, args.atr_mult_trail, args.rr_target, unit_value, partial_exit, partial_exit_pct, max_drawdown_pct, args.atr_mult_tp)
-        print(json.dumps(results, indent=4))
\ No newline at end of file
+        df_strategy = prepare_strategy(df, not args.no_signal_store, args.signal_store_dir, args.signal_store_mb * 1024 ** 2)
+        results = run_backtest(df_strategy, initial_capital, risk_pct, args.atr_mult_sl, args.atr_mult_trail, rr_target, unit_value, partial_exit, partial_exit_pct,
+                               equity_points=args.equity_points, equity_file=args.equity_file)
+        print(dumps_with_timings(results))
\ No newline at end of file
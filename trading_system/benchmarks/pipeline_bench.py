@@ -0,0 +1,145 @@
+import argparse
+import json
+import os
+import sys
+import time
+
+try:
+    import resource
+except ImportError:  # Windows: no peak RSS
+    resource = None
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from backtester import DEFAULT_PARAMS, add_indicators, add_regime, add_signals, stream_backtest
+from datacache import OHLCV_COLUMNS, parse_ohlcv
+from engine import S_EQUITY, extract_arrays, new_state, run_arrays, summarize, trades_to_records
+from synthetic import synthetic_file
+
+# Times every stage of a batch backtest on synthetic 1-minute data and compares the result with a stored baseline.
+#   python benchmarks/pipeline_bench.py --sizes 10k,1M --save_baseline    record the reference numbers
+#   python benchmarks/pipeline_bench.py --sizes 10k,1M                    exit 1 if any stage got slower
+# A missing baseline (or a size it has no numbers for) also fails, unless --allow_missing_baseline is passed.
+# Peak RSS is the process high-water mark after each stage, so sizes run smallest first.
+
+SIZES = {'10k': 10_000, '1M': 1_000_000, '10M': 10_000_000}
+STAGES = ['parse', 'indicators', 'regime', 'signals', 'bar_loop', 'serialization', 'stream']
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+BENCH_PARAMS = {'atr_mult_sl': 1.5, 'atr_mult_trail': 2.0, 'rr_target': 1.0}
+
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / 1024 ** 2 if sys.platform == 'darwin' else peak / 1024
+
+
+def _backtest_args():
+    params = dict(DEFAULT_PARAMS, **BENCH_PARAMS)
+    return [params[name] for name in ('initial_capital', 'risk_pct', 'atr_mult_sl', 'atr_mult_trail', 'rr_target', 'unit_value',
+                                      'partial_exit', 'partial_exit_pct')]
+
+
+def bench_size(n_bars, stream_bars=100_000, seed=0):
+    path = synthetic_file(n_bars, seed)
+    initial_capital, risk_pct, atr_mult_sl, atr_mult_trail, rr_target, unit_value, partial_exit, partial_exit_pct = args = _backtest_args()
+    stages = {}
+
+    def stage(name, func, *func_args, bars=n_bars):
+        start = time.perf_counter()
+        result = func(*func_args)
+        seconds = time.perf_counter() - start
+        stages[name] = {'seconds': seconds, 'bars_per_second': bars / seconds if seconds > 0 else None, 'peak_rss_mb': peak_rss_mb()}
+        return result
+
+    df = stage('parse', parse_ohlcv, path)
+    raw = df[OHLCV_COLUMNS].copy()
+    df = stage('indicators', add_indicators, df)
+    df = stage('regime', add_regime, df)
+    df = stage('signals', add_signals, df)
+
+    def bar_loop(arrays):
+        state = new_state(initial_capital)
+        trades, equity, recorded = run_arrays(arrays, state, 1, 0, risk_pct, atr_mult_sl, atr_mult_trail, rr_target, unit_value,
+                                              partial_exit, partial_exit_pct)
+        return state, trades, equity, recorded
+
+    arrays = extract_arrays(df)
+    bar_loop({name: values[:100] for name, values in arrays.items()})  # load / compile the numba kernel outside the timing
+    state, trades, equity, recorded = stage('bar_loop', bar_loop, arrays)
+
+    def serialize():
+        final_equity = state[S_EQUITY] if len(trades['pnl']) else initial_capital
+        equity_curve = [initial_capital] + equity[recorded].tolist()
+        return json.dumps(summarize(trades_to_records(trades, df.index), trades['pnl'], final_equity, equity_curve))
+
+    stage('serialization', serialize)
+
+    stream_df = raw.iloc[:stream_bars]
+    stage('stream', lambda: stream_backtest(stream_df, *args, emit=lambda line: None), bars=len(stream_df))
+
+    batch_seconds = sum(stages[name]['seconds'] for name in STAGES if name != 'stream')
+    return {
+        'bars': n_bars,
+        'trades': int(len(trades['pnl'])),
+        'stages': stages,
+        'batch_seconds': batch_seconds,
+        'batch_bars_per_second': n_bars / batch_seconds,
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+
+def compare(results, baseline, tolerance, min_seconds):
+    # A stage regresses when it is more than `tolerance` slower than the baseline and by more than min_seconds
+    regressions = []
+    for size, result in results['sizes'].items():
+        reference = baseline.get('sizes', {}).get(size)
+        if reference is None:
+            continue
+        for name, timing in result['stages'].items():
+            expected = reference['stages'].get(name, {}).get('seconds')
+            if expected is None:
+                continue
+            if timing['seconds'] > expected * (1 + tolerance) and timing['seconds'] - expected > min_seconds:
+                regressions.append({'size': size, 'stage': name, 'baseline_seconds': expected, 'seconds': timing['seconds'],
+                                    'ratio': timing['seconds'] / expected})
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', default='10k,1M', help=f'Comma separated subset of {", ".join(SIZES)}.')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--stream_bars', type=int, default=100_000, help='Bars replayed through stream_backtest.')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+    parser.add_argument('--save_baseline', action='store_true', help='Write these results to --baseline instead of comparing.')
+    parser.add_argument('--allow_missing_baseline', action='store_true',
+                        help='Only report a missing baseline (or baseline size) instead of exiting 1.')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='Allowed slowdown per stage, as a fraction of the baseline.')
+    parser.add_argument('--min_seconds', type=float, default=0.05, help='Ignore slowdowns smaller than this many seconds.')
+    args = parser.parse_args()
+    if not (args.save_baseline or args.allow_missing_baseline or os.path.isfile(args.baseline)):
+        parser.error(f'no baseline at {args.baseline}: run with --save_baseline to create it, or pass --allow_missing_baseline')
+
+    sizes = sorted((s.strip() for s in args.sizes.split(',')), key=lambda s: SIZES[s])
+    results = {'sizes': {size: bench_size(SIZES[size], args.stream_bars, args.seed) for size in sizes}}
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(results, f, indent=4)
+        print(json.dumps(results, indent=4))
+        raise SystemExit(0)
+
+    regressions = []
+    missing = sizes
+    if os.path.isfile(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance, args.min_seconds)
+        missing = [size for size in sizes if size not in baseline.get('sizes', {})]
+    if missing:
+        results['baseline'] = f'missing {", ".join(missing)}: run with --save_baseline to record them in {args.baseline}'
+    results['regressions'] = regressions
+    print(json.dumps(results, indent=4))
+    raise SystemExit(1 if regressions or (missing and not args.allow_missing_baseline) else 0)
@@ -0,0 +1,72 @@
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from backtester import classify_regime, regime_to_bars
+from indicators import REGIMES
+
+# Compares the row-wise regime step define_strategy used to run (df.apply + reindex/ffill into an object column)
+# with the vectorized integer-code version, on a synthetic 1-minute frame.
+
+
+def synthetic_hourly(n_bars, seed=0):
+    rng = np.random.default_rng(seed)
+    index = pd.date_range('2015-01-01', periods=n_bars, freq='1min')
+    close = pd.Series(1500 + np.cumsum(rng.normal(0, 0.3, n_bars)), index=index)
+    df_60m = close.resample('60min').last().to_frame('close')
+    df_60m['sma50'] = df_60m['close'].rolling(50).mean()
+    df_60m['sma50_prev'] = df_60m['sma50'].shift(1)
+    mid = df_60m['close'].rolling(20).mean()
+    std = df_60m['close'].rolling(20).std(ddof=0)
+    df_60m['bb_width'] = 100 * (4 * std) / mid
+    df_60m['bb_width_sma50'] = df_60m['bb_width'].rolling(50).mean()
+    return index, df_60m
+
+
+def legacy_regime(df_60m, index):
+    def get_regime(row):
+        if row['sma50'] > row['sma50_prev']: return "TREND_UP"
+        elif row['sma50'] < row['sma50_prev']: return "TREND_DOWN"
+        else: return "RANGE_HIGH_VOL" if row['bb_width'] > row['bb_width_sma50'] else "RANGE_LOW_VOL"
+    regime = df_60m.apply(get_regime, axis=1)
+    return regime.reindex(index, method='ffill').astype(object)
+
+
+def vectorized_regime(df_60m, index):
+    return pd.Series(pd.Categorical.from_codes(regime_to_bars(df_60m.index, classify_regime(df_60m), index), categories=REGIMES), index=index)
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--bars', type=int, default=3_000_000)
+    args = parser.parse_args()
+
+    index, df_60m = synthetic_hourly(args.bars)
+    legacy, legacy_seconds = timed(legacy_regime, df_60m, index)
+    vectorized, vectorized_seconds = timed(vectorized_regime, df_60m, index)
+
+    assert (legacy.to_numpy() == vectorized.astype(object).to_numpy()).all(), "vectorized regime differs from the row-wise version"
+    legacy_bytes = int(legacy.memory_usage(index=False, deep=True))
+    vectorized_bytes = int(vectorized.memory_usage(index=False, deep=True))
+    print(json.dumps({
+        "bars": args.bars,
+        "hours": len(df_60m),
+        "legacy_seconds": legacy_seconds,
+        "vectorized_seconds": vectorized_seconds,
+        "speedup": legacy_seconds / vectorized_seconds,
+        "legacy_bytes": legacy_bytes,
+        "vectorized_bytes": vectorized_bytes,
+        "memory_ratio": legacy_bytes / vectorized_bytes,
+    }, indent=4))
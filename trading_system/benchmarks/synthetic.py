@@ -0,0 +1,71 @@
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+# Deterministic synthetic 1-minute bars in the whitespace separated "date time open high low close volume"
+# format that backtester.py --filepath reads. The same (bars, seed) always gives the same file.
+
+START = '2015-01-01 00:00'
+WRITE_CHUNK = 1_000_000
+DEFAULT_DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+NS_PER_MINUTE = 60 * 1_000_000_000
+NS_PER_DAY = 1440 * NS_PER_MINUTE
+MINUTE_LABELS = np.array([f'{m // 60:02d}:{m % 60:02d}' for m in range(1440)], dtype=object)
+
+
+def generate_ohlcv(n_bars, seed=0, start=START, start_price=1500.0):
+    # Random walk closes with open / high / low around them; generated WRITE_CHUNK bars at a time
+    rng = np.random.default_rng(seed)
+    index = pd.date_range(start, periods=n_bars, freq='1min')
+    last_close = start_price
+    for begin in range(0, n_bars, WRITE_CHUNK):
+        n = min(WRITE_CHUNK, n_bars - begin)
+        close = last_close + np.cumsum(rng.normal(0, 0.3, n))
+        open_ = np.concatenate(([last_close], close[:-1])) + rng.normal(0, 0.05, n)
+        high = np.maximum(open_, close) + rng.random(n) * 0.4
+        low = np.minimum(open_, close) - rng.random(n) * 0.4
+        volume = rng.integers(1, 500, n)
+        last_close = close[-1]
+        yield pd.DataFrame({'open': open_, 'high': high, 'low': low, 'close': close, 'volume': volume},
+                           index=index[begin:begin + n])
+
+
+def _date_time_columns(index):
+    # strftime per bar dominates the write time; format each distinct day and minute of the day once instead
+    ns = index.values.astype('datetime64[ns]').astype(np.int64)
+    days, day_of_bar = np.unique(ns // NS_PER_DAY, return_inverse=True)
+    dates = pd.to_datetime(days * NS_PER_DAY).strftime('%Y.%m.%d').to_numpy(dtype=object)[day_of_bar]
+    times = MINUTE_LABELS[(ns % NS_PER_DAY) // NS_PER_MINUTE]
+    return dates, times
+
+
+def write_ohlcv(path, n_bars, seed=0):
+    with open(path, 'w') as f:
+        for chunk in generate_ohlcv(n_bars, seed):
+            dates, times = _date_time_columns(chunk.index)
+            chunk.insert(0, 'date', dates)
+            chunk.insert(1, 'time', times)
+            chunk.to_csv(f, sep=' ', header=False, index=False, float_format='%.2f')
+    return path
+
+
+def synthetic_file(n_bars, seed=0, data_dir=DEFAULT_DATA_DIR):
+    # Path of the generated file, written on first use and reused afterwards
+    os.makedirs(data_dir, exist_ok=True)
+    path = os.path.join(data_dir, f'synthetic_{n_bars}_{seed}.txt')
+    if not os.path.isfile(path):
+        tmp = f'{path}.{os.getpid()}.tmp'
+        write_ohlcv(tmp, n_bars, seed)
+        os.replace(tmp, path)
+    return path
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--bars', type=int, default=1_000_000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', required=True)
+    args = parser.parse_args()
+    write_ohlcv(args.output, args.bars, args.seed)
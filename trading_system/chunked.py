@@ -0,0 +1,122 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from datacache import iter_ohlcv_chunks
+from engine import S_ENTRY_IDX, S_EQUITY, S_SIDE, TRADE_TYPES, extract_arrays, new_state, run_arrays
+from indicators import index_to_ns
+from profiler import stage
+from streaming import format_time
+
+# Out-of-core backtest: the file is read chunk_bars rows at a time and only one chunk (plus its warm-up
+# history) is ever held in memory. Trades go to a JSON-lines file and the equity curve to a raw float64 file
+# as they are produced; the engine state vector carries the open position from one chunk to the next.
+
+DEFAULT_CHUNK_BARS = 500_000
+# History re-run in front of every chunk so the indicators are warmed up when the chunk starts.
+# The regime needs 50 + 20 hourly bars; ATR / RSI are exponential and forget their start after a few thousand bars.
+WARMUP_BARS = 20_000
+WARMUP_HOURS = 200
+
+TRADES_FILE = 'trades.jsonl'
+EQUITY_FILE = 'equity_curve.f64'
+PNL_FILE = 'pnl.f64'
+
+
+def _warmup_start(frame, warmup_bars, warmup_hours):
+    # First row of the history kept for the next chunk: at least warmup_bars bars and warmup_hours distinct hours
+    hours = frame.index.floor('60min').unique()
+    hour_start = frame.index.searchsorted(hours[-warmup_hours]) if len(hours) > warmup_hours else 0
+    return max(0, min(len(frame) - warmup_bars, hour_start))
+
+
+def iter_strategy_chunks(chunks, define_strategy, warmup_bars=WARMUP_BARS, warmup_hours=WARMUP_HOURS):
+    # Yields define_strategy output for consecutive, non-overlapping blocks of bars
+    history = None
+    pending = None
+    for chunk in chunks:
+        pending = chunk if pending is None else pd.concat([pending, chunk])
+        # The bars of the last, possibly unfinished hour wait for the next chunk: their regime uses that hour's final close
+        cut = pending.index.searchsorted(pending.index[-1].floor('60min'))
+        if cut == 0:
+            continue
+        ready, pending = pending.iloc[:cut], pending.iloc[cut:]
+        frame = ready if history is None else pd.concat([history, ready])
+        yield define_strategy(frame.copy()).iloc[len(frame) - len(ready):]
+        history = frame.iloc[_warmup_start(frame, warmup_bars, warmup_hours):]
+    if pending is not None and len(pending):
+        frame = pending if history is None else pd.concat([history, pending])
+        yield define_strategy(frame.copy()).iloc[len(frame) - len(pending):]
+
+
+def run_chunked_backtest(filepath, define_strategy, output_dir, initial_capital, risk_pct, atr_mult_sl, atr_mult_trail, rr_target,
+                         unit_value, partial_exit, partial_exit_pct, chunk_bars=DEFAULT_CHUNK_BARS):
+    # Same results as run_backtest on the whole file, except that trades / equity_curve are paths to files in output_dir
+    os.makedirs(output_dir, exist_ok=True)
+    trades_path = os.path.join(output_dir, TRADES_FILE)
+    equity_path = os.path.join(output_dir, EQUITY_FILE)
+    pnl_path = os.path.join(output_dir, PNL_FILE)
+
+    state = new_state(initial_capital)
+    offset = 0
+    start = 1  # the in-memory loop starts at the second bar
+    open_entry_ns = 0  # entry time of the position carried into the next chunk
+    n_trades = wins = losses = bars = 0
+    with open(trades_path, 'w') as trades_file, open(equity_path, 'wb') as equity_file, open(pnl_path, 'wb') as pnl_file:
+        np.array([initial_capital], dtype=np.float64).tofile(equity_file)
+        equity_points = 1
+        for df_strategy in iter_strategy_chunks(iter_ohlcv_chunks(filepath, chunk_bars), define_strategy):
+            times = index_to_ns(df_strategy.index)
+            with stage('bar_loop'):
+                trades, equity, recorded = run_arrays(extract_arrays(df_strategy), state, start, offset, risk_pct, atr_mult_sl,
+                                                      atr_mult_trail, rr_target, unit_value, partial_exit, partial_exit_pct)
+
+            with stage('trade_records'):
+                lines = []
+                for entry_idx, exit_idx, pnl, kind in zip(trades['entry_idx'].tolist(), trades['exit_idx'].tolist(),
+                                                          trades['pnl'].tolist(), trades['kind'].tolist()):
+                    entry_ns = times[entry_idx - offset] if entry_idx >= offset else open_entry_ns
+                    lines.append(json.dumps({'entry_time': format_time(entry_ns), 'exit_time': format_time(times[exit_idx - offset]),
+                                             'pnl': pnl, 'type': TRADE_TYPES[kind]}) + '\n')
+                trades_file.writelines(lines)
+                trades['pnl'].tofile(pnl_file)
+                equity[recorded].tofile(equity_file)
+
+            n_trades += len(trades['pnl'])
+            wins += int((trades['pnl'] > 0).sum())
+            losses += int((trades['pnl'] <= 0).sum())
+            equity_points += int(recorded.sum())
+            if state[S_SIDE] != 0.0 and state[S_ENTRY_IDX] >= offset:
+                open_entry_ns = times[int(state[S_ENTRY_IDX]) - offset]
+            bars += len(df_strategy)
+            offset += len(df_strategy)
+            start = 0
+
+    # np.mean over the whole pnl file, not a running sum, so avg_pnl rounds exactly like the in-memory summary
+    avg_pnl = float(np.mean(np.memmap(pnl_path, dtype=np.float64, mode='r'))) if n_trades > 0 else 0
+    return {
+        "final_equity": state[S_EQUITY] if n_trades else initial_capital,
+        "total_trades": n_trades,
+        "wins": wins,
+        "losses": losses,
+        "win_rate": (wins / n_trades * 100) if n_trades > 0 else 0,
+        "avg_pnl": avg_pnl,
+        "bars": bars,
+        "trades_file": trades_path,
+        "equity_curve_file": equity_path,
+        "equity_curve_points": equity_points,
+    }
+
+
+def load_equity_curve(path, mmap=True):
+    # The equity curve written by run_chunked_backtest, as a (memory-mapped) float64 array
+    if mmap:
+        return np.memmap(path, dtype=np.float64, mode='r')
+    return np.fromfile(path, dtype=np.float64)
+
+
+def load_trades(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f]
@@ -0,0 +1,137 @@
+import hashlib
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+from profiler import stage
+
+OHLCV_FILE_COLUMNS = ['date', 'time', 'open', 'high', 'low', 'close', 'volume']
+OHLCV_COLUMNS = ['open', 'high', 'low', 'close', 'volume']
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'cache')
+CACHE_VERSION = 1
+
+
+def _index_by_datetime(df):
+    df['datetime'] = pd.to_datetime(df['date'] + ' ' + df['time'])
+    df.set_index('datetime', inplace=True)
+    df.drop(['date', 'time'], axis=1, inplace=True)
+    return df
+
+
+def parse_ohlcv(filepath):
+    # Whitespace separated "date time open high low close volume" text, as exported for the notebooks
+    df = pd.read_csv(filepath, header=None, sep=r'\s+', names=OHLCV_FILE_COLUMNS)
+    return _index_by_datetime(df)
+
+
+def iter_ohlcv_chunks(filepath, chunk_bars):
+    # Same parsing as parse_ohlcv, chunk_bars rows at a time
+    with pd.read_csv(filepath, header=None, sep=r'\s+', names=OHLCV_FILE_COLUMNS, chunksize=chunk_bars) as reader:
+        while True:
+            with stage('parse'):
+                chunk = next(reader, None)
+                if chunk is None:
+                    return
+                chunk = _index_by_datetime(chunk)
+            yield chunk
+
+
+def file_digest(filepath):
+    # Hash of the file's bytes, for keying data that has no stable path
+    with open(filepath, 'rb') as f:
+        return hashlib.file_digest(f, 'sha1').hexdigest()
+
+
+def _path_key(filepath):
+    return hashlib.sha1(os.path.abspath(filepath).encode()).hexdigest()[:16]
+
+
+def cache_entry(filepath, cache_dir=DEFAULT_CACHE_DIR):
+    # One directory per (path, size, mtime); a changed file gets a new entry and the old one is dropped on write
+    stat = os.stat(filepath)
+    version = hashlib.sha1(f'{stat.st_size}:{stat.st_mtime_ns}:{CACHE_VERSION}'.encode()).hexdigest()[:16]
+    return os.path.join(cache_dir, f'{_path_key(filepath)}-{version}')
+
+
+def drop_stale_entries(entry):
+    # Remove the entries for other versions of entry's file. Entries of the same version (possibly just published
+    # by another process) and other processes' in-progress *.tmp directories are left alone.
+    parent, name = os.path.split(entry)
+    prefix = name.rsplit('-', 1)[0] + '-'
+    if not os.path.isdir(parent):
+        return 0
+    removed = 0
+    for other in os.listdir(parent):
+        if other.startswith(prefix) and other != name and not other.endswith('.tmp'):
+            shutil.rmtree(os.path.join(parent, other), ignore_errors=True)
+            removed += 1
+    return removed
+
+
+def write_cache(df, entry):
+    # Drop entries for older versions of the same file, then publish the new one with an atomic rename
+    drop_stale_entries(entry)
+    tmp = f'{entry}.{os.getpid()}.tmp'
+    os.makedirs(tmp)
+    np.save(os.path.join(tmp, 'datetime.npy'), df.index.values.astype('datetime64[ns]').astype(np.int64))
+    for column in OHLCV_COLUMNS:
+        np.save(os.path.join(tmp, f'{column}.npy'), df[column].to_numpy())
+    with open(os.path.join(tmp, 'meta.json'), 'w') as f:
+        json.dump({'rows': len(df), 'columns': OHLCV_COLUMNS, 'version': CACHE_VERSION}, f)
+    try:
+        os.replace(tmp, entry)
+    except OSError:
+        # Another process published the same entry first
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def read_cache(entry):
+    # Columns are memory-mapped; nothing is parsed
+    arrays = {column: np.asarray(np.load(os.path.join(entry, f'{column}.npy'), mmap_mode='r')) for column in OHLCV_COLUMNS}
+    times = np.load(os.path.join(entry, 'datetime.npy'), mmap_mode='r')
+    index = pd.DatetimeIndex(np.asarray(times).view('datetime64[ns]'), name='datetime')
+    return pd.DataFrame(arrays, index=index, copy=False)
+
+
+def invalidate(prefix, exact=True):
+    # Remove a cache entry, or with exact=False every entry whose directory starts with prefix
+    parent, name = os.path.split(prefix)
+    if not os.path.isdir(parent):
+        return 0
+    removed = 0
+    for entry in os.listdir(parent):
+        if entry == name or (not exact and entry.startswith(name + '-')):
+            shutil.rmtree(os.path.join(parent, entry), ignore_errors=True)
+            removed += 1
+    return removed
+
+
+def invalidate_file(filepath, cache_dir=DEFAULT_CACHE_DIR):
+    return invalidate(os.path.join(cache_dir, _path_key(filepath)), exact=False)
+
+
+def load_ohlcv(filepath, use_cache=True, cache_dir=DEFAULT_CACHE_DIR):
+    if not use_cache:
+        with stage('parse'):
+            return parse_ohlcv(filepath)
+    entry = cache_entry(filepath, cache_dir)
+    if os.path.isfile(os.path.join(entry, 'meta.json')):
+        with stage('cache_read'):
+            return read_cache(entry)
+    with stage('parse'):
+        df = parse_ohlcv(filepath)
+    try:
+        with stage('cache_write'):
+            write_cache(df, entry)
+    except OSError:
+        # A read-only or full cache directory should not stop the backtest
+        return df
+    try:
+        with stage('cache_read'):
+            return read_cache(entry)
+    except OSError:
+        # The entry was replaced or cleared by another process in between; the parsed frame is just as good
+        return df
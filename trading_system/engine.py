@@ -0,0 +1,402 @@
+import numpy as np
+
+from indicators import index_to_ns
+from metrics import compute_metrics, lttb, write_curve
+from profiler import stage
+
+try:
+    from numba import njit
+except ImportError:  # Numba is optional, the kernel also runs as plain Python
+    njit = None
+
+TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+# Trade kinds as stored in the kernel's trade buffers
+LONG, SHORT, LONG_PARTIAL, SHORT_PARTIAL = 0, 1, 2, 3
+TRADE_TYPES = ('long', 'short', 'long_partial', 'short_partial')
+
+# Layout of the state vector carried between kernel calls, so a run can be resumed on the next block of bars
+S_EQUITY, S_SIDE, S_ENTRY_PRICE, S_STOP, S_TP, S_QTY, S_PARTIAL, S_EXTREME, S_ENTRY_IDX = range(9)
+STATE_SIZE = 9
+
+ENGINE_COLUMNS = ['high', 'low', 'close', 'ATR_14', 'long_signal', 'short_signal']
+
+
+def new_state(initial_capital):
+    state = np.zeros(STATE_SIZE)
+    state[S_EQUITY] = initial_capital
+    return state
+
+
+def _open_position(direction, close, atr, equity, risk_pct, atr_mult_sl, rr_target, unit_value):
+    # Entry rule for a signal on a bar: direction 1.0 long / -1.0 short.
+    # Returns (sl_dist, quantity, stop_loss, take_profit); sl_dist == 0 skips the bar, quantity == 0 opens nothing.
+    sl_dist = atr * atr_mult_sl
+    if sl_dist == 0:
+        return sl_dist, 0.0, np.nan, np.nan
+    tp_dist = sl_dist * rr_target
+    max_risk_amount = equity * risk_pct
+    qty = np.floor(max_risk_amount / (sl_dist * unit_value))
+    if direction == 1.0:
+        return sl_dist, qty, close - sl_dist, close + tp_dist
+    return sl_dist, qty, close + sl_dist, close - tp_dist
+
+
+def _partial_target(side, entry_price, take_profit):
+    # The partial exit fills halfway to the take profit
+    if side == 1.0:
+        return entry_price + (take_profit - entry_price) * 0.5
+    return entry_price - (entry_price - take_profit) * 0.5
+
+
+def _position_pnl(side, entry_price, exit_price, quantity, unit_value):
+    if side == 1.0:
+        return (exit_price - entry_price) * quantity * unit_value
+    return (entry_price - exit_price) * quantity * unit_value
+
+
+def _trail_stop(side, extreme, stop_loss, trail_dist):
+    # The stop follows the extreme at trail_dist, and only ever tightens
+    if side == 1.0:
+        trail_stop_price = extreme - trail_dist
+        return trail_stop_price if trail_stop_price > stop_loss else stop_loss
+    trail_stop_price = extreme + trail_dist
+    return trail_stop_price if trail_stop_price < stop_loss else stop_loss
+
+
+def _bar_exit_step(side, high, low, atr, entry_price, stop_loss, take_profit, quantity, partial_exited, extreme,
+                   atr_mult_trail, unit_value, partial_exit, partial_exit_pct):
+    # One bar of an open position from its high / low: partial target, trailing stop, then stop before take profit.
+    # Returns (partial_filled, partial_pnl, exited, exit_pnl, stop_loss, quantity, partial_exited, extreme);
+    # the caller books the partial pnl before the exit pnl.
+    partial_filled = False
+    partial_pnl = 0.0
+    if partial_exit and not partial_exited:
+        partial_tp_price = partial_target(side, entry_price, take_profit)
+        if (high >= partial_tp_price) if side == 1.0 else (low <= partial_tp_price):
+            partial_qty = quantity * partial_exit_pct
+            partial_pnl = position_pnl(side, entry_price, partial_tp_price, partial_qty, unit_value)
+            partial_filled = True
+            quantity -= partial_qty
+            partial_exited = True
+
+    if side == 1.0:
+        if high > extreme:
+            extreme = high
+    elif low < extreme:
+        extreme = low
+    stop_loss = trail_stop(side, extreme, stop_loss, atr * atr_mult_trail)
+
+    exit_price = np.nan
+    if side == 1.0:
+        if low <= stop_loss:
+            exit_price = stop_loss
+        elif high >= take_profit:
+            exit_price = take_profit
+    else:
+        if high >= stop_loss:
+            exit_price = stop_loss
+        elif low <= take_profit:
+            exit_price = take_profit
+    exited = exit_price == exit_price
+    exit_pnl = position_pnl(side, entry_price, exit_price, quantity, unit_value) if exited else 0.0
+    return partial_filled, partial_pnl, exited, exit_pnl, stop_loss, quantity, partial_exited, extreme
+
+
+def jit_kernel(func):
+    return njit(cache=True, nogil=True)(func) if njit is not None else func
+
+
+# The trading rules shared by every kernel (bar, portfolio, tick); compiled so the kernels can call them
+open_position = jit_kernel(_open_position)
+partial_target = jit_kernel(_partial_target)
+position_pnl = jit_kernel(_position_pnl)
+trail_stop = jit_kernel(_trail_stop)
+bar_exit_step = jit_kernel(_bar_exit_step)
+
+
+def _bar_loop(high, low, close, atr, long_signal, short_signal, state, start, offset,
+              risk_pct, atr_mult_sl, atr_mult_trail, rr_target, unit_value, partial_exit, partial_exit_pct,
+              trade_entry, trade_exit, trade_pnl, trade_kind, equity_curve, recorded):
+    # The original df.iloc loop's rules (run_backtest_reference): open_position / bar_exit_step repeat its arithmetic
+    # operation for operation, so that every float is produced by the same sequence of operations.
+    # Indices written to trade_entry / trade_exit are shifted by `offset` (position of this block in the full series).
+    n_trades = 0
+    equity = state[S_EQUITY]
+    side = state[S_SIDE]
+    entry_price = state[S_ENTRY_PRICE]
+    stop_loss = state[S_STOP]
+    take_profit = state[S_TP]
+    quantity = state[S_QTY]
+    partial_exited = state[S_PARTIAL] != 0.0
+    extreme = state[S_EXTREME]
+    entry_idx = int(state[S_ENTRY_IDX])
+
+    for i in range(start, len(close)):
+        if side == 0.0:
+            direction = 1.0 if long_signal[i] else (-1.0 if short_signal[i] else 0.0)
+            if direction != 0.0:
+                sl_dist, qty, new_stop, new_tp = open_position(direction, close[i], atr[i], equity, risk_pct, atr_mult_sl, rr_target, unit_value)
+                if sl_dist == 0:
+                    continue
+                if qty > 0:
+                    side = direction
+                    entry_price = close[i]
+                    stop_loss = new_stop
+                    take_profit = new_tp
+                    quantity = qty
+                    partial_exited = False
+                    extreme = high[i] if direction == 1.0 else low[i]
+                    entry_idx = offset + i
+
+        else:
+            partial_filled, partial_pnl, exited, exit_pnl, stop_loss, quantity, partial_exited, extreme = bar_exit_step(
+                side, high[i], low[i], atr[i], entry_price, stop_loss, take_profit, quantity, partial_exited, extreme,
+                atr_mult_trail, unit_value, partial_exit, partial_exit_pct)
+            if partial_filled:
+                equity += partial_pnl
+                trade_entry[n_trades] = entry_idx
+                trade_exit[n_trades] = offset + i
+                trade_pnl[n_trades] = partial_pnl
+                trade_kind[n_trades] = LONG_PARTIAL if side == 1.0 else SHORT_PARTIAL
+                n_trades += 1
+            if exited:
+                equity += exit_pnl
+                trade_entry[n_trades] = entry_idx
+                trade_exit[n_trades] = offset + i
+                trade_pnl[n_trades] = exit_pnl
+                trade_kind[n_trades] = LONG if side == 1.0 else SHORT
+                n_trades += 1
+                side = 0.0
+
+        equity_curve[i] = equity
+        recorded[i] = True
+
+    state[S_EQUITY] = equity
+    state[S_SIDE] = side
+    state[S_ENTRY_PRICE] = entry_price
+    state[S_STOP] = stop_loss
+    state[S_TP] = take_profit
+    state[S_QTY] = quantity
+    state[S_PARTIAL] = 1.0 if partial_exited else 0.0
+    state[S_EXTREME] = extreme
+    state[S_ENTRY_IDX] = entry_idx
+    return n_trades
+
+
+bar_loop = jit_kernel(_bar_loop)
+
+
+def extract_arrays(df):
+    # Pull the columns the bar loop needs into contiguous NumPy arrays once
+    return {
+        'high': np.ascontiguousarray(df['high'].to_numpy(dtype=np.float64)),
+        'low': np.ascontiguousarray(df['low'].to_numpy(dtype=np.float64)),
+        'close': np.ascontiguousarray(df['close'].to_numpy(dtype=np.float64)),
+        'ATR_14': np.ascontiguousarray(df['ATR_14'].to_numpy(dtype=np.float64)),
+        'long_signal': np.ascontiguousarray(df['long_signal'].to_numpy(dtype=np.bool_)),
+        'short_signal': np.ascontiguousarray(df['short_signal'].to_numpy(dtype=np.bool_)),
+    }
+
+
+TRADE_FIELDS = (('entry_idx', np.int64), ('exit_idx', np.int64), ('pnl', np.float64), ('kind', np.int8))
+
+
+def trade_buffers(capacity):
+    # Empty trade record buffers (TRADE_FIELDS) for a kernel to fill
+    return {name: np.empty(capacity, dtype=dtype) for name, dtype in TRADE_FIELDS}
+
+
+def trim_trades(buffers, n_trades):
+    return {name: values[:n_trades] for name, values in buffers.items()}
+
+
+def kernel_inputs(columns):
+    # Plain Python indexes lists far faster than NumPy arrays
+    return list(columns) if njit is not None else [c.tolist() for c in columns]
+
+
+def run_arrays(arrays, state, start, offset, risk_pct, atr_mult_sl, atr_mult_trail, rr_target, unit_value, partial_exit, partial_exit_pct):
+    # Run the kernel over one block of bars. Returns the trade buffers trimmed to the trades produced,
+    # the per-bar equity and the mask of bars that the original loop would have appended to equity_curve.
+    n = len(arrays['close'])
+    # A position needs at least one bar to enter and one to exit, so a block yields at most n + 2 trade records
+    trades = trade_buffers(n + 2)
+    equity_curve = np.empty(n, dtype=np.float64)
+    recorded = np.zeros(n, dtype=np.bool_)
+
+    n_trades = bar_loop(*kernel_inputs(arrays[c] for c in ENGINE_COLUMNS), state, start, offset,
+                        risk_pct, atr_mult_sl, atr_mult_trail, rr_target, unit_value, bool(partial_exit), partial_exit_pct,
+                        *trades.values(), equity_curve, recorded)
+    return trim_trades(trades, n_trades), equity_curve, recorded
+
+
+def trades_to_records(trades, index):
+    # strftime only the bars that actually opened or closed a trade
+    entry_times = index[trades['entry_idx']].strftime(TIME_FORMAT)
+    exit_times = index[trades['exit_idx']].strftime(TIME_FORMAT)
+    return [
+        {'entry_time': entry_time, 'exit_time': exit_time, 'pnl': pnl, 'type': TRADE_TYPES[kind]}
+        for entry_time, exit_time, pnl, kind in zip(entry_times, exit_times, trades['pnl'].tolist(), trades['kind'].tolist())
+    ]
+
+
+def summarize(trades, pnl, final_equity, equity_curve):
+    n_trades = len(pnl)
+    wins = int((pnl > 0).sum())
+    return {
+        "final_equity": final_equity,
+        "total_trades": n_trades,
+        "wins": wins,
+        "losses": int((pnl <= 0).sum()),
+        "win_rate": (wins / n_trades * 100) if n_trades > 0 else 0,
+        "avg_pnl": np.mean(pnl) if n_trades > 0 else 0,
+        "trades": trades,
+        "equity_curve": equity_curve
+    }
+
+
+def run_bar_engine(df, initial_capital, risk_pct, atr_mult_sl, atr_mult_trail, rr_target, unit_value, partial_exit, partial_exit_pct,
+                   equity_points=None, equity_file=None):
+    # equity_points: return an LTTB-downsampled equity curve of about this many points instead of one value per bar
+    # equity_file: also write the full curve there as raw float64
+    with stage('bar_loop'):
+        arrays = extract_arrays(df)
+        state = new_state(initial_capital)
+        trades, equity, recorded = run_arrays(arrays, state, 1, 0, risk_pct, atr_mult_sl, atr_mult_trail, rr_target, unit_value, partial_exit, partial_exit_pct)
+    return build_results(df, trades, state, equity, recorded, initial_capital, equity_points, equity_file)
+
+
+def build_results(df, trades, state, equity, recorded, initial_capital, equity_points=None, equity_file=None):
+    # Results dict of a finished in-memory run (kernel output over all of df), with metrics and the equity curve
+    with stage('metrics'):
+        times = index_to_ns(df.index)
+        curve = np.concatenate(([initial_capital], equity[recorded]))
+        curve_times = np.concatenate((times[:1], times[recorded]))
+        metrics = compute_metrics(trades, times, curve, curve_times, len(df))
+
+    with stage('trade_records'):
+        final_equity = state[S_EQUITY] if len(trades['pnl']) else initial_capital
+        if equity_points:
+            kept = lttb(np.arange(len(curve)), curve, equity_points)
+            equity_curve = curve[kept].tolist()
+        else:
+            equity_curve = [initial_capital] + equity[recorded].tolist()
+        results = summarize(trades_to_records(trades, df.index), trades['pnl'], final_equity, equity_curve)
+        results["metrics"] = metrics
+        if equity_points:
+            # Positions of the kept points in the full curve, for the chart's x axis
+            results["equity_curve_index"] = kept.tolist()
+            results["equity_curve_length"] = len(curve)
+        if equity_file:
+            results["equity_curve_file"] = write_curve(equity_file, curve)
+        return results
+
+
+# The original df.iloc row loop. Kept as the definition of the trading rules: run_bar_engine must reproduce its results.
+def run_backtest_reference(df, initial_capital, risk_pct, atr_mult_sl, atr_mult_trail, rr_target, unit_value, partial_exit, partial_exit_pct):
+    trades = []
+    equity = initial_capital
+    equity_curve = [initial_capital]
+    position = None
+    highest_since_entry = 0
+    lowest_since_entry = 0
+
+    for i in range(1, len(df)):
+        row = df.iloc[i]
+        
+        if position is None:
+            if row['long_signal']:
+                sl_dist = row['ATR_14'] * atr_mult_sl
+                if sl_dist == 0: continue
+                tp_dist = sl_dist * rr_target
+                stop_loss = row['close'] - sl_dist
+                take_profit = row['close'] + tp_dist
+                
+                max_risk_amount = equity * risk_pct
+                qty = np.floor(max_risk_amount / (sl_dist * unit_value))
+
+                if qty > 0:
+                    position = {'type': 'long', 'entry_price': row['close'], 'stop_loss': stop_loss, 'take_profit': take_profit, 'quantity': qty, 'entry_time': row.name.strftime('%Y-%m-%d %H:%M:%S')}
+                    highest_since_entry = row['high']
+            
+            elif row['short_signal']:
+                sl_dist = row['ATR_14'] * atr_mult_sl
+                if sl_dist == 0: continue
+                tp_dist = sl_dist * rr_target
+                stop_loss = row['close'] + sl_dist
+                take_profit = row['close'] - tp_dist
+
+                max_risk_amount = equity * risk_pct
+                qty = np.floor(max_risk_amount / (sl_dist * unit_value))
+
+                if qty > 0:
+                    position = {'type': 'short', 'entry_price': row['close'], 'stop_loss': stop_loss, 'take_profit': take_profit, 'quantity': qty, 'entry_time': row.name.strftime('%Y-%m-%d %H:%M:%S')}
+                    lowest_since_entry = row['low']
+
+        elif position is not None:
+            if position['type'] == 'long':
+                if partial_exit and not position.get('partial_exited', False):
+                    partial_tp_price = position['entry_price'] + (position['take_profit'] - position['entry_price']) * 0.5
+                    if row['high'] >= partial_tp_price:
+                        partial_qty = position['quantity'] * partial_exit_pct
+                        pnl = (partial_tp_price - position['entry_price']) * partial_qty * unit_value
+                        equity += pnl
+                        trades.append({'entry_time': position['entry_time'], 'exit_time': row.name.strftime('%Y-%m-%d %H:%M:%S'), 'pnl': pnl, 'type': 'long_partial'})
+                        position['quantity'] -= partial_qty
+                        position['partial_exited'] = True
+
+                highest_since_entry = max(highest_since_entry, row['high'])
+                trail_stop_price = highest_since_entry - row['ATR_14'] * atr_mult_trail
+                position['stop_loss'] = max(position['stop_loss'], trail_stop_price)
+
+                if row['low'] <= position['stop_loss']:
+                    pnl = (position['stop_loss'] - position['entry_price']) * position['quantity'] * unit_value
+                    equity += pnl
+                    trades.append({'entry_time': position['entry_time'], 'exit_time': row.name.strftime('%Y-%m-%d %H:%M:%S'), 'pnl': pnl, 'type': 'long'})
+                    position = None
+                elif row['high'] >= position['take_profit']:
+                    pnl = (position['take_profit'] - position['entry_price']) * position['quantity'] * unit_value
+                    equity += pnl
+                    trades.append({'entry_time': position['entry_time'], 'exit_time': row.name.strftime('%Y-%m-%d %H:%M:%S'), 'pnl': pnl, 'type': 'long'})
+                    position = None
+            
+            elif position['type'] == 'short':
+                if partial_exit and not position.get('partial_exited', False):
+                    partial_tp_price = position['entry_price'] - (position['entry_price'] - position['take_profit']) * 0.5
+                    if row['low'] <= partial_tp_price:
+                        partial_qty = position['quantity'] * partial_exit_pct
+                        pnl = (position['entry_price'] - partial_tp_price) * partial_qty * unit_value
+                        equity += pnl
+                        trades.append({'entry_time': position['entry_time'], 'exit_time': row.name.strftime('%Y-%m-%d %H:%M:%S'), 'pnl': pnl, 'type': 'short_partial'})
+                        position['quantity'] -= partial_qty
+                        position['partial_exited'] = True
+
+                lowest_since_entry = min(lowest_since_entry, row['low'])
+                trail_stop_price = lowest_since_entry + row['ATR_14'] * atr_mult_trail
+                position['stop_loss'] = min(position['stop_loss'], trail_stop_price)
+
+                if row['high'] >= position['stop_loss']:
+                    pnl = (position['entry_price'] - position['stop_loss']) * position['quantity'] * unit_value
+                    equity += pnl
+                    trades.append({'entry_time': position['entry_time'], 'exit_time': row.name.strftime('%Y-%m-%d %H:%M:%S'), 'pnl': pnl, 'type': 'short'})
+                    position = None
+                elif row['low'] <= position['take_profit']:
+                    pnl = (position['entry_price'] - position['take_profit']) * position['quantity'] * unit_value
+                    equity += pnl
+                    trades.append({'entry_time': position['entry_time'], 'exit_time': row.name.strftime('%Y-%m-%d %H:%M:%S'), 'pnl': pnl, 'type': 'short'})
+                    position = None
+        
+        equity_curve.append(equity)
+
+    results = {
+        "final_equity": equity,
+        "total_trades": len(trades),
+        "wins": len([t for t in trades if t['pnl'] > 0]),
+        "losses": len([t for t in trades if t['pnl'] <= 0]),
+        "win_rate": (len([t for t in trades if t['pnl'] > 0]) / len(trades) * 100) if len(trades) > 0 else 0,
+        "avg_pnl": np.mean([t['pnl'] for t in trades]) if len(trades) > 0 else 0,
+        "trades": trades,
+        "equity_curve": equity_curve
+    }
+    return results
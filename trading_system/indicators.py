@@ -0,0 +1,436 @@
+import math
+from collections import deque
+from importlib.util import find_spec
+
+import numpy as np
+import pandas as pd
+
+# Incremental versions of the indicators define_strategy computes with pandas / pandas_ta.
+# Every update is O(1) and follows the same arithmetic as the batch code, so a replay reproduces the batch columns.
+# pandas_ta computes ATR / RSI / SMA with TA-Lib when it is installed (and define_strategy needs TA-Lib for the
+# candle patterns), otherwise with pandas ewm / rolling kernels; IncrementalStrategy follows the same choice.
+# The TA-Lib versions seed ATR and RSI with a simple average, so their warm-up values differ from the pandas ones.
+# The hourly regime always uses the pandas rolling kernels; with TA-Lib its SMA / Bollinger values agree with the
+# batch ones to rounding only.
+
+NS_PER_HOUR = 3_600_000_000_000
+TALIB = find_spec('talib') is not None
+EPSILON = np.finfo(float).eps
+
+REGIME_UNKNOWN = "UNKNOWN"
+REGIME_TREND_UP = "TREND_UP"
+REGIME_TREND_DOWN = "TREND_DOWN"
+REGIME_RANGE_HIGH_VOL = "RANGE_HIGH_VOL"
+REGIME_RANGE_LOW_VOL = "RANGE_LOW_VOL"
+
+# Regimes are stored as small integer codes into this tuple (pandas Categorical on the frame)
+REGIMES = (REGIME_UNKNOWN, REGIME_TREND_UP, REGIME_TREND_DOWN, REGIME_RANGE_HIGH_VOL, REGIME_RANGE_LOW_VOL)
+CODE_UNKNOWN, CODE_TREND_UP, CODE_TREND_DOWN, CODE_RANGE_HIGH_VOL, CODE_RANGE_LOW_VOL = range(len(REGIMES))
+
+# define_strategy only classifies regimes once it has this many 1-minute bars
+REGIME_MIN_BARS = 60
+
+
+class EwmMean:
+    # Series.ewm(alpha=alpha, min_periods=min_periods).mean() with adjust=True,
+    # which is what pandas_ta's rma (Wilder smoothing) uses for ATR and RSI
+    def __init__(self, alpha, min_periods):
+        self.old_wt_factor = 1.0 - alpha
+        self.min_periods = min_periods
+        self.weighted = math.nan
+        self.old_wt = 1.0
+        self.nobs = 0
+        self.value = math.nan
+
+    def update(self, x):
+        is_observation = x == x
+        self.nobs += is_observation
+        if self.weighted == self.weighted:
+            self.old_wt *= self.old_wt_factor
+            if is_observation:
+                if self.weighted != x:
+                    self.weighted = (self.old_wt * self.weighted + x) / (self.old_wt + 1.0)
+                self.old_wt += 1.0
+        elif is_observation:
+            self.weighted = x
+        self.value = self.weighted if self.nobs >= self.min_periods else math.nan
+        return self.value
+
+
+class RollingMean:
+    # Series.rolling(length).mean() over a ring buffer, with the same compensated running sum as pandas
+    def __init__(self, length):
+        self.length = length
+        self.window = deque()
+        self.nobs = 0
+        self.sum_x = 0.0
+        self.comp_add = 0.0
+        self.comp_remove = 0.0
+        self.neg_ct = 0
+        self.same_ct = 0
+        self.prev_value = math.nan
+
+    def _state(self):
+        return [self.nobs, self.sum_x, self.comp_add, self.comp_remove, self.neg_ct, self.same_ct, self.prev_value]
+
+    def _step(self, state, x, dropped):
+        nobs, sum_x, comp_add, comp_remove, neg_ct, same_ct, prev_value = state
+        if dropped is not None and dropped == dropped:
+            nobs -= 1
+            y = -dropped - comp_remove
+            t = sum_x + y
+            comp_remove = t - sum_x - y
+            sum_x = t
+            if math.copysign(1.0, dropped) < 0:
+                neg_ct -= 1
+        if x == x:
+            nobs += 1
+            y = x - comp_add
+            t = sum_x + y
+            comp_add = t - sum_x - y
+            sum_x = t
+            if math.copysign(1.0, x) < 0:
+                neg_ct += 1
+            same_ct = same_ct + 1 if x == prev_value else 1
+            prev_value = x
+        return [nobs, sum_x, comp_add, comp_remove, neg_ct, same_ct, prev_value]
+
+    @staticmethod
+    def _mean(state, length):
+        nobs, sum_x, _, _, neg_ct, same_ct, prev_value = state
+        if nobs < length or nobs == 0:
+            return math.nan
+        if same_ct >= nobs:
+            return prev_value
+        result = sum_x / nobs
+        if neg_ct == 0 and result < 0:
+            return 0.0
+        if neg_ct == nobs and result > 0:
+            return 0.0
+        return result
+
+    def peek(self, x):
+        # Mean the window would have if x were appended, without committing it
+        dropped = self.window[0] if len(self.window) == self.length else None
+        return self._mean(self._step(self._state(), x, dropped), self.length)
+
+    def update(self, x):
+        dropped = self.window.popleft() if len(self.window) == self.length else None
+        self.window.append(x)
+        (self.nobs, self.sum_x, self.comp_add, self.comp_remove,
+         self.neg_ct, self.same_ct, self.prev_value) = self._step(self._state(), x, dropped)
+        return self._mean(self._state(), self.length)
+
+
+class RollingVar:
+    # Series.rolling(length).var(ddof) using pandas' compensated Welford updates
+    def __init__(self, length, ddof=0):
+        self.length = length
+        self.ddof = ddof
+        self.window = deque()
+        self.nobs = 0
+        self.mean_x = 0.0
+        self.ssqdm_x = 0.0
+        self.comp_add = 0.0
+        self.comp_remove = 0.0
+        self.same_ct = 0
+        self.prev_value = math.nan
+
+    def _state(self):
+        return [self.nobs, self.mean_x, self.ssqdm_x, self.comp_add, self.comp_remove, self.same_ct, self.prev_value]
+
+    def _step(self, state, x, dropped):
+        nobs, mean_x, ssqdm_x, comp_add, comp_remove, same_ct, prev_value = state
+        if dropped is not None and dropped == dropped:
+            nobs -= 1
+            if nobs:
+                prev_mean = mean_x - comp_remove
+                y = dropped - comp_remove
+                t = y - mean_x
+                comp_remove = t + mean_x - y
+                mean_x -= t / nobs
+                ssqdm_x -= (dropped - prev_mean) * (dropped - mean_x)
+            else:
+                mean_x = 0.0
+                ssqdm_x = 0.0
+        if x == x:
+            same_ct = same_ct + 1 if x == prev_value else 1
+            prev_value = x
+            nobs += 1
+            prev_mean = mean_x - comp_add
+            y = x - comp_add
+            t = y - mean_x
+            comp_add = t + mean_x - y
+            mean_x = mean_x + t / nobs
+            ssqdm_x += (x - prev_mean) * (x - mean_x)
+            if same_ct >= nobs:
+                # Window holds a single repeated value: drop accumulated rounding like pandas does
+                mean_x = x
+                ssqdm_x = 0.0
+        return [nobs, mean_x, ssqdm_x, comp_add, comp_remove, same_ct, prev_value]
+
+    def _var(self, state):
+        nobs, _, ssqdm_x, _, _, same_ct, _ = state
+        if nobs < self.length or nobs <= self.ddof:
+            return math.nan
+        if nobs == 1 or same_ct >= nobs:
+            return 0.0
+        return max(ssqdm_x / (nobs - self.ddof), 0.0)
+
+    def peek(self, x):
+        dropped = self.window[0] if len(self.window) == self.length else None
+        return self._var(self._step(self._state(), x, dropped))
+
+    def update(self, x):
+        dropped = self.window.popleft() if len(self.window) == self.length else None
+        self.window.append(x)
+        (self.nobs, self.mean_x, self.ssqdm_x, self.comp_add, self.comp_remove,
+         self.same_ct, self.prev_value) = self._step(self._state(), x, dropped)
+        return self._var(self._state())
+
+
+class Atr:
+    # pandas_ta atr: true range smoothed with rma
+    def __init__(self, length=14):
+        self.rma = EwmMean(1.0 / length, length)
+        self.prev_close = math.nan
+
+    def update(self, high, low, close):
+        high_low = high - low
+        if high_low == 0:
+            high_low += EPSILON
+        if self.prev_close == self.prev_close:
+            true_range = max(abs(high_low), abs(high - self.prev_close), abs(self.prev_close - low))
+        else:
+            true_range = math.nan
+        self.prev_close = close
+        return self.rma.update(true_range)
+
+
+class Rsi:
+    # pandas_ta rsi: rma of gains over rma of gains plus |rma of losses|
+    def __init__(self, length=14):
+        self.gains = EwmMean(1.0 / length, length)
+        self.losses = EwmMean(1.0 / length, length)
+        self.prev_close = math.nan
+
+    def update(self, close):
+        change = close - self.prev_close
+        self.prev_close = close
+        positive_avg = self.gains.update(change if not change < 0 else 0.0)
+        negative_avg = self.losses.update(change if not change > 0 else 0.0)
+        return 100 * positive_avg / (positive_avg + abs(negative_avg))
+
+
+class TalibSma:
+    # talib.SMA: a plain running sum (no compensation), divided by the length
+    def __init__(self, length):
+        self.length = length
+        self.window = deque()
+        self.total = 0.0
+
+    def update(self, x):
+        self.window.append(x)
+        self.total += x
+        if len(self.window) < self.length:
+            return math.nan
+        value = self.total / self.length
+        self.total -= self.window.popleft()
+        return value
+
+
+class TalibAtr:
+    # talib.ATR: the first value is the mean of the first `length` true ranges, then Wilder smoothing
+    def __init__(self, length=14):
+        self.length = length
+        self.prev_close = math.nan
+        self.seed_total = 0.0
+        self.seen = 0
+        self.value = math.nan
+
+    def update(self, high, low, close):
+        prev_close = self.prev_close
+        self.prev_close = close
+        if prev_close != prev_close:
+            return math.nan
+        true_range = max(high - low, abs(prev_close - high), abs(prev_close - low))
+        self.seen += 1
+        if self.seen < self.length:
+            self.seed_total += true_range
+        elif self.seen == self.length:
+            self.value = (self.seed_total + true_range) / self.length
+        else:
+            self.value = (self.value * (self.length - 1) + true_range) / self.length
+        return self.value
+
+
+class TalibRsi:
+    # talib.RSI: average gain / loss seeded with the mean of the first `length` changes, then Wilder smoothing
+    def __init__(self, length=14):
+        self.length = length
+        self.prev_close = math.nan
+        self.gain = 0.0
+        self.loss = 0.0
+        self.seen = 0
+
+    def update(self, close):
+        change = close - self.prev_close
+        self.prev_close = close
+        if change != change:
+            return math.nan
+        self.seen += 1
+        if self.seen > self.length:
+            self.gain *= self.length - 1
+            self.loss *= self.length - 1
+        if change < 0:
+            self.loss -= change
+        else:
+            self.gain += change
+        if self.seen < self.length:
+            return math.nan
+        self.gain /= self.length
+        self.loss /= self.length
+        total = self.gain + self.loss
+        # TA_IS_ZERO
+        return 100.0 * (self.gain / total) if not -1e-8 < total < 1e-8 else 0.0
+
+
+class CandlePatterns:
+    # TA-Lib CDLENGULFING / CDLHAMMER (default candle settings) from the current and previous bars only.
+    # Hammer averages: BodyShort = real body over 10 bars, ShadowVeryShort = 0.1 * range over 10 bars,
+    # Near = 0.2 * range over 5 bars ending one bar earlier. Running totals are kept the way TA-Lib keeps them.
+    def __init__(self):
+        self.bars = 0
+        self.prev = None
+        self.prev_low = math.nan
+        self.bodies = deque(maxlen=11)
+        self.ranges = deque(maxlen=11)
+        self.body_total = 0.0
+        self.shadow_total = 0.0
+        self.near_total = 0.0
+
+    def update(self, open_, high, low, close):
+        i = self.bars
+        self.bars += 1
+        body = abs(close - open_)
+        hl_range = high - low
+        self.bodies.append(body)
+        self.ranges.append(hl_range)
+
+        engulfing = 0
+        if i >= 2:
+            prev_open, prev_close = self.prev
+            color = 1 if close >= open_ else -1
+            prev_color = 1 if prev_close >= prev_open else -1
+            if (color == 1 and prev_color == -1 and close > prev_open and open_ < prev_close) or \
+               (color == -1 and prev_color == 1 and open_ > prev_close and close < prev_open):
+                engulfing = color * 100
+
+        hammer = 0
+        if i >= 11:
+            prev_low = self.prev_low
+            if body < self.body_total / 10.0 and \
+               min(close, open_) - low > body and \
+               high - max(close, open_) < 0.1 * (self.shadow_total / 10.0) and \
+               min(close, open_) <= prev_low + 0.2 * (self.near_total / 5.0):
+                hammer = 100
+            self.body_total += body - self.bodies[0]
+            self.shadow_total += hl_range - self.ranges[0]
+            self.near_total += self.ranges[-2] - self.ranges[-7]
+        else:
+            if i >= 1:
+                self.body_total += body
+                self.shadow_total += hl_range
+            if 5 <= i <= 9:
+                self.near_total += hl_range
+
+        self.prev = (open_, close)
+        self.prev_low = low
+        return engulfing, hammer
+
+
+class HourlyRegime:
+    # Online 60-minute bar aggregator with the regime state define_strategy computes on the resampled frame.
+    # The forming hour is treated as the last row of the resample, i.e. the regime the batch code would
+    # assign if the data ended at the current bar.
+    def __init__(self):
+        self.hour = None
+        self.close = math.nan
+        self.sma50 = RollingMean(50)
+        self.bb_mid = RollingMean(20)
+        self.bb_var = RollingVar(20, ddof=0)
+        self.bb_width_sma50 = RollingMean(50)
+        self.last_sma50 = math.nan
+
+    @staticmethod
+    def _bb_width(mid, var):
+        deviations = 2.0 * math.sqrt(var) if var == var else math.nan
+        upper_lower = (mid + deviations) - (mid - deviations)
+        if upper_lower == 0:
+            upper_lower += EPSILON
+        return 100 * upper_lower / mid
+
+    def _close_hour(self):
+        self.last_sma50 = self.sma50.update(self.close)
+        width = self._bb_width(self.bb_mid.update(self.close), self.bb_var.update(self.close))
+        self.bb_width_sma50.update(width)
+
+    def update(self, hour, close):
+        if self.hour is not None and hour != self.hour:
+            self._close_hour()
+        self.hour = hour
+        self.close = close
+
+        sma50 = self.sma50.peek(close)
+        if sma50 > self.last_sma50:
+            return REGIME_TREND_UP
+        if sma50 < self.last_sma50:
+            return REGIME_TREND_DOWN
+        width = self._bb_width(self.bb_mid.peek(close), self.bb_var.peek(close))
+        return REGIME_RANGE_HIGH_VOL if width > self.bb_width_sma50.peek(width) else REGIME_RANGE_LOW_VOL
+
+
+class IncrementalStrategy:
+    # Bar-by-bar equivalent of define_strategy: feed one 1-minute bar, get that bar's indicator row back.
+    # talib: use the TA-Lib formulas for ATR / RSI / SMA (default: whenever pandas_ta would)
+    def __init__(self, talib=None):
+        talib = TALIB if talib is None else talib
+        self.bars = 0
+        self.atr = TalibAtr(14) if talib else Atr(14)
+        self.rsi = TalibRsi(14) if talib else Rsi(14)
+        self.sma20 = TalibSma(20) if talib else RollingMean(20)
+        self.sma50 = TalibSma(50) if talib else RollingMean(50)
+        self.regime = HourlyRegime()
+        self.candles = CandlePatterns()
+
+    def update(self, time_ns, open_, high, low, close, volume):
+        self.bars += 1
+        atr = self.atr.update(high, low, close)
+        rsi = self.rsi.update(close)
+        sma20 = self.sma20.update(close)
+        sma50 = self.sma50.update(close)
+        regime = self.regime.update(time_ns // NS_PER_HOUR, close)
+        if self.bars < REGIME_MIN_BARS:
+            regime = REGIME_UNKNOWN
+        engulfing, hammer = self.candles.update(open_, high, low, close)
+
+        long_signal = (engulfing > 0 or hammer > 0) and regime != REGIME_TREND_DOWN and sma20 > sma50
+        short_signal = engulfing < 0 and regime != REGIME_TREND_UP and sma20 < sma50
+        return {
+            'open': open_, 'high': high, 'low': low, 'close': close, 'volume': volume,
+            'ATR_14': atr, 'RSI_14': rsi, 'SMA_20': sma20, 'SMA_50': sma50, 'regime': regime,
+            'CDL_ENGULFING': engulfing, 'CDL_HAMMER': hammer,
+            'long_signal': long_signal, 'short_signal': short_signal,
+        }
+
+
+def index_to_ns(index):
+    return index.values.astype('datetime64[ns]').astype(np.int64)
+
+
+def replay(df, talib=None):
+    # Feed df through IncrementalStrategy bar by bar and collect the rows, for comparison with define_strategy
+    strategy = IncrementalStrategy(talib)
+    columns = [df[c].to_numpy(dtype=np.float64).tolist() for c in ['open', 'high', 'low', 'close', 'volume']]
+    rows = [strategy.update(t, *bar) for t, *bar in zip(index_to_ns(df.index).tolist(), *columns)]
+    return pd.DataFrame(rows, index=df.index)
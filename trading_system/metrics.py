@@ -0,0 +1,126 @@
+import numpy as np
+
+# Performance metrics over the engine's array-backed records: the trade buffers from engine.run_arrays
+# (entry_idx / exit_idx / pnl / kind), the bar times in ns and the equity curve. Everything is NumPy; nothing
+# loops over trade dicts.
+
+NS_PER_MINUTE = 60 * 1_000_000_000
+NS_PER_DAY = 1440 * NS_PER_MINUTE
+PERIODS_PER_YEAR = 252  # daily returns are annualized with sqrt(PERIODS_PER_YEAR)
+DURATION_BINS_MINUTES = [0, 5, 15, 30, 60, 240, 1440, 10080]  # last bin is open-ended
+POSITION_KINDS = (0, 1)  # engine.LONG, engine.SHORT: the record that closes a position (partials are not positions)
+
+
+def max_drawdown(curve):
+    # Largest peak-to-trough fall, in percent of the peak and in account currency
+    curve = np.asarray(curve, dtype=np.float64)
+    peaks = np.maximum.accumulate(curve)
+    drawdown = peaks - curve
+    return float((drawdown / peaks).max() * 100), float(drawdown.max())
+
+
+def period_returns(times, curve, period_ns=NS_PER_DAY):
+    # Returns between the last equity values of consecutive periods (days by default) that have bars
+    periods = np.asarray(times) // period_ns
+    last = np.flatnonzero(np.append(periods[1:] != periods[:-1], True))
+    closes = np.asarray(curve, dtype=np.float64)[np.concatenate(([0], last))]
+    return np.diff(closes) / closes[:-1]
+
+
+def sharpe_sortino(returns, periods_per_year=PERIODS_PER_YEAR):
+    # Annualized, zero risk-free rate; None when there is not enough variation to divide by
+    if len(returns) < 2:
+        return None, None
+    mean = returns.mean()
+    std = returns.std(ddof=1)
+    downside = np.sqrt(np.mean(np.minimum(returns, 0.0) ** 2))
+    scale = np.sqrt(periods_per_year)
+    sharpe = float(mean / std * scale) if std > 0 else None
+    sortino = float(mean / downside * scale) if downside > 0 else None
+    return sharpe, sortino
+
+
+def trade_stats(pnl):
+    wins = pnl[pnl > 0]
+    losses = pnl[pnl <= 0]
+    gross_profit = float(wins.sum())
+    gross_loss = float(-losses.sum())
+    n = len(pnl)
+    return {
+        "gross_profit": gross_profit,
+        "gross_loss": gross_loss,
+        # None instead of infinity when nothing was lost, so the payload stays valid JSON
+        "profit_factor": gross_profit / gross_loss if gross_loss > 0 else None,
+        "avg_win": float(wins.mean()) if len(wins) else 0,
+        "avg_loss": float(losses.mean()) if len(losses) else 0,
+        # Mean pnl per trade record: win_rate * avg_win + loss_rate * avg_loss
+        "expectancy": float(pnl.mean()) if n else 0,
+    }
+
+
+def duration_distribution(minutes):
+    counts = np.histogram(minutes, bins=DURATION_BINS_MINUTES + [np.inf])[0] if len(minutes) else np.zeros(len(DURATION_BINS_MINUTES), dtype=np.int64)
+    distribution = {"histogram": {"bins_minutes": DURATION_BINS_MINUTES, "counts": counts.tolist()}}
+    if len(minutes):
+        p25, median, p75, p90 = np.percentile(minutes, [25, 50, 75, 90]).tolist()
+        distribution.update({"mean": float(minutes.mean()), "min": float(minutes.min()), "p25": p25, "median": median,
+                             "p75": p75, "p90": p90, "max": float(minutes.max())})
+    return distribution
+
+
+def compute_metrics(trades, times, curve, curve_times, n_bars, periods_per_year=PERIODS_PER_YEAR):
+    # trades: engine trade buffers with indices into `times`; curve / curve_times: the equity curve and its bar times
+    pnl = trades['pnl']
+    closes_position = np.isin(trades['kind'], POSITION_KINDS)
+    entry_idx = trades['entry_idx'][closes_position]
+    exit_idx = trades['exit_idx'][closes_position]
+    minutes = (times[exit_idx] - times[entry_idx]) / NS_PER_MINUTE
+
+    drawdown_pct, drawdown = max_drawdown(curve)
+    sharpe, sortino = sharpe_sortino(period_returns(curve_times, curve), periods_per_year)
+    return {
+        "max_drawdown_pct": drawdown_pct,
+        "max_drawdown": drawdown,
+        "sharpe": sharpe,
+        "sortino": sortino,
+        **trade_stats(pnl),
+        "positions": int(closes_position.sum()),
+        # Share of bars with an open position (closed positions only)
+        "exposure_pct": float((exit_idx - entry_idx).sum() / n_bars * 100) if n_bars else 0,
+        "duration_minutes": duration_distribution(minutes),
+    }
+
+
+def lttb(x, y, n_out):
+    # Largest-Triangle-Three-Buckets: indices of n_out points that keep the visual shape of (x, y).
+    # One Python step per output bucket, NumPy within each bucket.
+    n = len(y)
+    if n_out >= n or n <= 2:
+        return np.arange(n)
+    n_out = max(n_out, 3)
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    # Buckets over the points between the fixed first and last ones
+    edges = (np.arange(n_out - 1) * ((n - 2) / (n_out - 2))).astype(np.int64) + 1
+    edges[-1] = n - 1
+    selected = np.empty(n_out, dtype=np.int64)
+    selected[0] = 0
+    a = 0
+    for b in range(n_out - 2):
+        start, end = edges[b], edges[b + 1]
+        if b + 2 < len(edges):
+            next_x = x[end:edges[b + 2]].mean()
+            next_y = y[end:edges[b + 2]].mean()
+        else:
+            next_x, next_y = x[n - 1], y[n - 1]
+        area = np.abs((x[a] - next_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (next_y - y[a]))
+        a = start + int(area.argmax())
+        selected[b + 1] = a
+    selected[-1] = n - 1
+    return selected
+
+
+def write_curve(path, curve):
+    # Full equity curve as raw float64, the same layout as chunked.EQUITY_FILE
+    np.asarray(curve, dtype=np.float64).tofile(path)
+    return path
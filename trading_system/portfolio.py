@@ -0,0 +1,175 @@
+import heapq
+import os
+from multiprocessing import Pool
+
+import numpy as np
+import pandas as pd
+
+from engine import (ENGINE_COLUMNS, LONG, LONG_PARTIAL, S_ENTRY_IDX, S_ENTRY_PRICE, S_EXTREME, S_PARTIAL, S_QTY, S_SIDE, S_STOP,
+                    S_TP, SHORT, SHORT_PARTIAL, STATE_SIZE, TIME_FORMAT, TRADE_TYPES, bar_exit_step, extract_arrays, jit_kernel,
+                    kernel_inputs, open_position, trade_buffers, trim_trades)
+from indicators import index_to_ns
+from profiler import stage
+
+# Multi-symbol backtest: one position per symbol, all of them sized from and paid into one shared equity.
+# Per-symbol bars stay in their own time-sorted arrays (concatenated, with start / end offsets); the event loop
+# walks them in timestamp order with a k-way heap merge. Bars with equal timestamps run in symbol order.
+
+
+def _portfolio_loop(times, cursor, ends, high, low, close, atr, long_signal, short_signal, unit_values, states, equity,
+                    risk_pct, atr_mult_sl, atr_mult_trail, rr_target, partial_exit, partial_exit_pct,
+                    trade_symbol, trade_entry, trade_exit, trade_pnl, trade_kind, event_equity, event_time):
+    # Per bar, the rules of engine._bar_loop (open_position / bar_exit_step); `cursor` holds each symbol's next bar.
+    # Returns the trade count, the number of equity events written and the final equity.
+    heap = [(times[cursor[s]], s) for s in range(len(cursor)) if cursor[s] < ends[s]]
+    heapq.heapify(heap)
+    n_trades = 0
+    n_events = 0
+    while heap:
+        time_ns, s = heapq.heappop(heap)
+        i = cursor[s]
+        cursor[s] = i + 1
+        if i + 1 < ends[s]:
+            heapq.heappush(heap, (times[i + 1], s))
+
+        state = states[s]
+        unit_value = unit_values[s]
+        side = state[S_SIDE]
+        if side == 0.0:
+            direction = 1.0 if long_signal[i] else (-1.0 if short_signal[i] else 0.0)
+            if direction != 0.0:
+                sl_dist, qty, stop_loss, take_profit = open_position(direction, close[i], atr[i], equity, risk_pct, atr_mult_sl,
+                                                                     rr_target, unit_value)
+                if sl_dist == 0:
+                    continue
+                if qty > 0:
+                    state[S_SIDE] = direction
+                    state[S_ENTRY_PRICE] = close[i]
+                    state[S_STOP] = stop_loss
+                    state[S_TP] = take_profit
+                    state[S_QTY] = qty
+                    state[S_PARTIAL] = 0.0
+                    state[S_EXTREME] = high[i] if direction == 1.0 else low[i]
+                    state[S_ENTRY_IDX] = i
+
+        else:
+            partial_filled, partial_pnl, exited, exit_pnl, stop_loss, quantity, partial_exited, extreme = bar_exit_step(
+                side, high[i], low[i], atr[i], state[S_ENTRY_PRICE], state[S_STOP], state[S_TP], state[S_QTY],
+                state[S_PARTIAL] != 0.0, state[S_EXTREME], atr_mult_trail, unit_value, partial_exit, partial_exit_pct)
+            state[S_STOP] = stop_loss
+            state[S_QTY] = quantity
+            state[S_PARTIAL] = 1.0 if partial_exited else 0.0
+            state[S_EXTREME] = extreme
+            if partial_filled:
+                equity += partial_pnl
+                trade_symbol[n_trades] = s
+                trade_entry[n_trades] = int(state[S_ENTRY_IDX])
+                trade_exit[n_trades] = i
+                trade_pnl[n_trades] = partial_pnl
+                trade_kind[n_trades] = LONG_PARTIAL if side == 1.0 else SHORT_PARTIAL
+                n_trades += 1
+            if exited:
+                equity += exit_pnl
+                trade_symbol[n_trades] = s
+                trade_entry[n_trades] = int(state[S_ENTRY_IDX])
+                trade_exit[n_trades] = i
+                trade_pnl[n_trades] = exit_pnl
+                trade_kind[n_trades] = LONG if side == 1.0 else SHORT
+                n_trades += 1
+                state[S_SIDE] = 0.0
+
+        event_equity[n_events] = equity
+        event_time[n_events] = time_ns
+        n_events += 1
+
+    return n_trades, n_events, equity
+
+
+portfolio_loop = jit_kernel(_portfolio_loop)
+
+
+def _prepare_symbol(task):
+    # Worker: indicators and signals for one symbol, returned as the engine arrays plus bar times
+    load_strategy, filepath = task
+    df_strategy = load_strategy(filepath)
+    arrays = extract_arrays(df_strategy)
+    arrays['time'] = index_to_ns(df_strategy.index)
+    return arrays
+
+
+def prepare_symbols(filepaths, load_strategy, workers=None):
+    # load_strategy(filepath) -> define_strategy output; one process per symbol, up to `workers` at a time
+    workers = min(workers or os.cpu_count(), len(filepaths))
+    with stage('symbol_strategies'), Pool(workers) as pool:
+        return pool.map(_prepare_symbol, [(load_strategy, filepath) for filepath in filepaths], chunksize=1)
+
+
+def _summary(pnl):
+    n_trades = len(pnl)
+    wins = int((pnl > 0).sum())
+    return {
+        "total_trades": n_trades,
+        "wins": wins,
+        "losses": int((pnl <= 0).sum()),
+        "win_rate": (wins / n_trades * 100) if n_trades > 0 else 0,
+        "avg_pnl": float(np.mean(pnl)) if n_trades > 0 else 0,
+        "total_pnl": float(pnl.sum()),
+    }
+
+
+def run_portfolio(symbols, arrays, initial_capital, risk_pct, atr_mult_sl, atr_mult_trail, rr_target, partial_exit, partial_exit_pct):
+    # symbols: list of (name, unit_value); arrays: prepare_symbols output in the same order
+    for (name, _), symbol_arrays in zip(symbols, arrays):
+        if len(symbol_arrays['time']) > 1 and (np.diff(symbol_arrays['time']) < 0).any():
+            raise ValueError(f'bars of {name} are not sorted by time')
+
+    lengths = np.array([len(a['time']) for a in arrays], dtype=np.int64)
+    ends = np.cumsum(lengths)
+    # Each symbol skips its first bar, like the single-symbol loop
+    cursor = np.minimum(ends - lengths + 1, ends)
+    times = np.concatenate([a['time'] for a in arrays])
+    columns = [np.concatenate([a[c] for a in arrays]) for c in ENGINE_COLUMNS]
+    unit_values = np.array([unit_value for _, unit_value in symbols], dtype=np.float64)
+    states = np.zeros((len(symbols), STATE_SIZE))
+
+    n = len(times)
+    # Every symbol can leave one position open across its last bar
+    buffers = trade_buffers(n + 2 * len(symbols))
+    trade_symbol = np.empty(n + 2 * len(symbols), dtype=np.int64)
+    event_equity = np.empty(n, dtype=np.float64)
+    event_time = np.empty(n, dtype=np.int64)
+
+    with stage('bar_loop'):
+        n_trades, n_events, final_equity = portfolio_loop(
+            *kernel_inputs([times, cursor, ends, *columns, unit_values, states]), float(initial_capital), risk_pct, atr_mult_sl,
+            atr_mult_trail, rr_target, bool(partial_exit), partial_exit_pct, trade_symbol, *buffers.values(), event_equity, event_time)
+
+    with stage('trade_records'):
+        trade_symbol = trade_symbol[:n_trades]
+        trade_records = trim_trades(buffers, n_trades)
+        pnl = trade_records['pnl']
+        entry_times = pd.DatetimeIndex(times[trade_records['entry_idx']]).strftime(TIME_FORMAT)
+        exit_times = pd.DatetimeIndex(times[trade_records['exit_idx']]).strftime(TIME_FORMAT)
+        names = [name for name, _ in symbols]
+        trades = [
+            {'symbol': names[s], 'entry_time': entry_time, 'exit_time': exit_time, 'pnl': p, 'type': TRADE_TYPES[kind]}
+            for s, entry_time, exit_time, p, kind in zip(trade_symbol.tolist(), entry_times, exit_times, pnl.tolist(),
+                                                         trade_records['kind'].tolist())
+        ]
+
+        # One equity point per timestamp: the equity after the last bar at that time
+        event_time = event_time[:n_events]
+        last_at_time = np.append(event_time[1:] != event_time[:-1], True) if n_events else np.zeros(0, dtype=np.bool_)
+        equity_curve = [initial_capital] + event_equity[:n_events][last_at_time].tolist()
+
+    per_symbol = {}
+    for s, (name, unit_value) in enumerate(symbols):
+        per_symbol[name] = {"unit_value": unit_value, "bars": int(lengths[s]), **_summary(pnl[trade_symbol == s])}
+
+    return {
+        "final_equity": final_equity if n_trades else initial_capital,
+        **_summary(pnl),
+        "symbols": per_symbol,
+        "trades": trades,
+        "equity_curve": equity_curve,
+    }
@@ -0,0 +1,124 @@
+import cProfile
+import json
+import os
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+
+# Stage timers for --profile. Code marks its stages with `with stage('name'):`; unless a profiling run is
+# active that is a shared no-op context, so the marks can stay in the hot paths.
+# Stages must not nest: each one resets the tracemalloc peak.
+
+MB = 1024 ** 2
+
+_active = None
+_cprofile = None
+_pstats_path = None
+_started_tracemalloc = False
+_NOOP = nullcontext()
+
+
+class StageProfiler:
+    def __init__(self, allocations=True):
+        self.allocations = allocations
+        self.stages = {}
+        self.started = time.perf_counter()
+
+    @contextmanager
+    def stage(self, name):
+        if self.allocations:
+            tracemalloc.reset_peak()
+            before = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            # A stage that runs several times (chunks, folds) accumulates
+            entry = self.stages.setdefault(name, {'seconds': 0.0, 'calls': 0})
+            entry['seconds'] += time.perf_counter() - start
+            entry['calls'] += 1
+            if self.allocations:
+                current, peak = tracemalloc.get_traced_memory()
+                entry['alloc_peak_mb'] = max(entry.get('alloc_peak_mb', 0.0), (peak - before) / MB)
+                entry['alloc_net_mb'] = entry.get('alloc_net_mb', 0.0) + (current - before) / MB
+
+    def report(self):
+        return {
+            'total_seconds': time.perf_counter() - self.started,
+            'stages': self.stages,
+            'allocations_traced': self.allocations,
+        }
+
+
+def stage(name):
+    return _active.stage(name) if _active is not None else _NOOP
+
+
+def active_profiler():
+    return _active
+
+
+def start_profiling(allocations=True, pstats_path=None):
+    # allocations: trace allocations with tracemalloc (slows allocation-heavy Python code down noticeably)
+    # pstats_path: also run cProfile and dump its stats there when profiling stops
+    global _active, _cprofile, _pstats_path, _started_tracemalloc
+    _active = StageProfiler(allocations)
+    _started_tracemalloc = allocations and not tracemalloc.is_tracing()
+    if _started_tracemalloc:
+        tracemalloc.start()
+    _pstats_path = pstats_path
+    if pstats_path:
+        _cprofile = cProfile.Profile()
+        _cprofile.enable()
+    return _active
+
+
+def stop_profiling():
+    global _active, _cprofile, _started_tracemalloc
+    profiler = _active
+    _active = None
+    if _cprofile is not None:
+        _cprofile.disable()
+        _cprofile.dump_stats(_pstats_path)
+        _cprofile = None
+    if _started_tracemalloc:
+        tracemalloc.stop()
+        _started_tracemalloc = False
+    return profiler
+
+
+def _reset_in_child():
+    # Forked pool workers (sweep, walk-forward, portfolio) must not keep tracing or write the parent's pstats file
+    global _active, _cprofile, _started_tracemalloc
+    if _cprofile is not None:
+        _cprofile.disable()
+    if _started_tracemalloc:
+        tracemalloc.stop()
+    _active = None
+    _cprofile = None
+    _started_tracemalloc = False
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_in_child)
+
+
+@contextmanager
+def profiling(allocations=True, pstats_path=None):
+    profiler = start_profiling(allocations, pstats_path)
+    try:
+        yield profiler
+    finally:
+        stop_profiling()
+
+
+def dumps_with_timings(results, indent=4):
+    # json.dumps(results), timed as the 'serialization' stage; with an active profiler the text gets a trailing
+    # "timings" block, spliced in so the (possibly large) results are encoded only once
+    with stage('serialization'):
+        text = json.dumps(results, indent=indent)
+    if _active is None or not results:
+        return text
+    timings = json.dumps(_active.report(), indent=indent).replace('\n', '\n' + ' ' * (indent or 0))
+    separator = ',\n' + ' ' * indent if indent else ', '
+    return text[:-2 if indent else -1] + separator + '"timings": ' + timings + ('\n}' if indent else '}')
@@ -0,0 +1,134 @@
+import hashlib
+import json
+import os
+import shutil
+from importlib.metadata import PackageNotFoundError, version
+
+import numpy as np
+import pandas as pd
+
+from datacache import DEFAULT_CACHE_DIR, OHLCV_COLUMNS
+from indicators import TALIB
+from profiler import stage
+
+DEFAULT_STORE_DIR = os.path.join(DEFAULT_CACHE_DIR, 'signals')
+DEFAULT_MAX_BYTES = 2 * 1024 ** 3
+# Part of every key: bump it when the stored layout or define_strategy's output dtypes change (2: regime is a Categorical)
+STORE_VERSION = 2
+
+
+def _package_version(name):
+    try:
+        return version(name)
+    except PackageNotFoundError:
+        return None
+
+
+# Also part of every key: pandas_ta's values change with its version and with TA-Lib (ATR / RSI seeding, see indicators.py)
+LIBRARIES = {'pandas_ta': _package_version('pandas_ta'), 'talib': TALIB,
+             'talib_version': _package_version('TA-Lib') if TALIB else None}
+
+
+def data_fingerprint(df):
+    # Content hash of the bars, so the same data uploaded under a different file name still hits the store
+    digest = hashlib.sha1()
+    digest.update(np.ascontiguousarray(df.index.values.astype('datetime64[ns]')).view(np.uint8))
+    for column in OHLCV_COLUMNS:
+        digest.update(np.ascontiguousarray(df[column].to_numpy()).view(np.uint8))
+    return digest.hexdigest()
+
+
+def store_key(df, config):
+    payload = json.dumps({'data': data_fingerprint(df), 'config': config, 'libraries': LIBRARIES, 'version': STORE_VERSION},
+                         sort_keys=True)
+    return hashlib.sha1(payload.encode()).hexdigest()
+
+
+def _entry_size(entry):
+    return sum(os.path.getsize(os.path.join(entry, f)) for f in os.listdir(entry))
+
+
+def evict(store_dir, max_bytes):
+    # Least recently used entries go first; the meta.json mtime is bumped on every hit
+    entries = []
+    for name in os.listdir(store_dir):
+        meta = os.path.join(store_dir, name, 'meta.json')
+        if os.path.isfile(meta):
+            entries.append((os.path.getmtime(meta), _entry_size(os.path.join(store_dir, name)), name))
+    total = sum(size for _, size, _ in entries)
+    for _, size, name in sorted(entries):
+        if total <= max_bytes:
+            break
+        shutil.rmtree(os.path.join(store_dir, name), ignore_errors=True)
+        total -= size
+
+
+def save_signals(df_strategy, key, store_dir=DEFAULT_STORE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+    entry = os.path.join(store_dir, key)
+    tmp = f'{entry}.{os.getpid()}.tmp'
+    os.makedirs(tmp)
+    columns = {}
+    for column in df_strategy.columns:
+        if column in OHLCV_COLUMNS:
+            continue
+        values = df_strategy[column]
+        if not (pd.api.types.is_numeric_dtype(values) or pd.api.types.is_bool_dtype(values)):
+            # String columns (regime) are stored as category codes
+            categorical = pd.Categorical(values)
+            np.save(os.path.join(tmp, f'{column}.npy'), categorical.codes)
+            columns[column] = {'categories': categorical.categories.tolist(), 'dtype': str(values.dtype)}
+        else:
+            np.save(os.path.join(tmp, f'{column}.npy'), values.to_numpy())
+            columns[column] = {}
+    with open(os.path.join(tmp, 'meta.json'), 'w') as f:
+        json.dump({'rows': len(df_strategy), 'columns': columns}, f)
+    try:
+        os.replace(tmp, entry)
+    except OSError:
+        shutil.rmtree(tmp, ignore_errors=True)
+    evict(store_dir, max_bytes)
+
+
+def load_signals(df, key, store_dir=DEFAULT_STORE_DIR):
+    # df with the stored indicator / signal columns attached, or None on a miss
+    entry = os.path.join(store_dir, key)
+    meta_path = os.path.join(entry, 'meta.json')
+    try:
+        with open(meta_path) as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if meta['rows'] != len(df):
+        return None
+
+    df_strategy = df.copy()
+    try:
+        for column, info in meta['columns'].items():
+            values = np.asarray(np.load(os.path.join(entry, f'{column}.npy'), mmap_mode='r'))
+            if 'categories' in info:
+                # Code -1 marks a missing value; non-categorical string columns get their original dtype back
+                values = pd.Categorical.from_codes(values, categories=info['categories'])
+                if info['dtype'] != 'category':
+                    values = pd.Series(values, index=df.index).astype(info['dtype'])
+            df_strategy[column] = values
+        os.utime(meta_path)
+    except OSError:
+        # Evicted by another process (evict / --clear_cache) while it was being read: a miss, recomputed by the caller
+        return None
+    return df_strategy
+
+
+def load_or_compute(df, compute, config, store_dir=DEFAULT_STORE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+    with stage('signal_store_read'):
+        key = store_key(df, config)
+        df_strategy = load_signals(df, key, store_dir)
+    if df_strategy is not None:
+        return df_strategy
+    df_strategy = compute()
+    try:
+        with stage('signal_store_write'):
+            os.makedirs(store_dir, exist_ok=True)
+            save_signals(df_strategy, key, store_dir, max_bytes)
+    except OSError:
+        pass
+    return df_strategy
@@ -0,0 +1,159 @@
+import base64
+import json
+import struct
+import time
+
+# Output pipeline for stream_backtest.
+# encoding:
+#   'json'    legacy: one {"type": "price_update", ...} object per bar, or {"type": "price_batch", "bars": [...]} when batching
+#   'compact' columnar batch with epoch-second timestamps: {"type": "price_batch", "t": [...], "open": [...], ...}
+#   'struct'  fixed-layout little-endian records (STRUCT_FORMAT), base64 encoded inside a JSON line
+# Trade events are never dropped: they travel as "trade_event" on legacy bars and as a "trade_events" list on batches.
+# stats_ms (--profile): every stats_ms a {"type": "stats", ...} message with bars/sec and the wall time between bars.
+
+STREAM_ENCODINGS = ['json', 'compact', 'struct']
+STRUCT_FORMAT = '<q6d'  # epoch seconds, open, high, low, close, volume, equity
+STRUCT_FIELDS = ['t', 'open', 'high', 'low', 'close', 'volume', 'equity']
+
+
+def format_time(time_ns):
+    # Same text as Timestamp.strftime('%Y-%m-%d %H:%M:%S') for naive timestamps, without building a Timestamp
+    return time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(time_ns // 1_000_000_000))
+
+
+class StreamWriter:
+    def __init__(self, emit=print, encoding='json', batch_bars=None, batch_ms=None, max_fps=None, stats_ms=None):
+        # batch_bars / batch_ms: flush after this many bars or this much wall time, whichever comes first;
+        # with only batch_ms there is no bar limit, with neither every bar is flushed on its own.
+        # max_fps: at most this many frames per second; bars between frames are merged into one OHLC bar.
+        # stats_ms: emit throughput / per-bar latency stats this often.
+        self.emit = emit
+        self.encoding = encoding
+        self.batch_seconds = batch_ms / 1000 if batch_ms else None
+        self.batch_bars = max(1, batch_bars) if batch_bars else (None if self.batch_seconds else 1)
+        self.frame_seconds = 1.0 / max_fps if max_fps else None
+        self.columns = {field: [] for field in STRUCT_FIELDS}
+        self.timestamps = []
+        self.trade_events = []
+        self.last_flush = time.perf_counter()
+        self.legacy = encoding == 'json' and self.batch_bars == 1 and not self.batch_seconds and not self.frame_seconds
+        self.stats_seconds = stats_ms / 1000 if stats_ms else None
+        self.stats_total = 0
+        self._reset_stats(self.last_flush)
+
+    def _reset_stats(self, now):
+        self.stats_start = now
+        self.stats_last_bar = now
+        self.stats_bars = 0
+        self.stats_max_latency = 0.0
+
+    def _record_bar(self):
+        # Latency is the wall time since the previous bar: indicator update, trade logic and output of one bar
+        now = time.perf_counter()
+        latency = now - self.stats_last_bar
+        self.stats_last_bar = now
+        self.stats_bars += 1
+        if latency > self.stats_max_latency:
+            self.stats_max_latency = latency
+        if now - self.stats_start >= self.stats_seconds:
+            self._emit_stats(now)
+
+    def _emit_stats(self, now):
+        elapsed = now - self.stats_start
+        self.stats_total += self.stats_bars
+        self.emit(json.dumps({
+            "type": "stats",
+            "bars": self.stats_total,
+            "interval_bars": self.stats_bars,
+            "bars_per_sec": self.stats_bars / elapsed if elapsed > 0 else None,
+            "latency_us_avg": elapsed / self.stats_bars * 1e6 if self.stats_bars else None,
+            "latency_us_max": self.stats_max_latency * 1e6,
+        }))
+        self._reset_stats(now)
+
+    def bar(self, time_ns, timestamp, open_, high, low, close, volume, equity, trade_event=None):
+        if self.stats_seconds:
+            self._record_bar()
+        if self.legacy:
+            output_data = {
+                "type": "price_update",
+                "timestamp": timestamp,
+                "open": open_,
+                "high": high,
+                "low": low,
+                "close": close,
+                "volume": volume,
+                "equity": equity
+            }
+            if trade_event:
+                output_data["trade_event"] = trade_event
+            self.emit(json.dumps(output_data))
+            return
+
+        columns = self.columns
+        columns['t'].append(time_ns // 1_000_000_000)
+        columns['open'].append(open_)
+        columns['high'].append(high)
+        columns['low'].append(low)
+        columns['close'].append(close)
+        columns['volume'].append(volume)
+        columns['equity'].append(equity)
+        self.timestamps.append(timestamp)
+        if trade_event:
+            self.trade_events.append(trade_event)
+
+        now = time.perf_counter()
+        if self.frame_seconds:
+            if now - self.last_flush >= self.frame_seconds:
+                self.flush(now)
+        elif (self.batch_bars and len(columns['t']) >= self.batch_bars) or (self.batch_seconds and now - self.last_flush >= self.batch_seconds):
+            self.flush(now)
+
+    def _downsample(self):
+        # Merge the pending bars into a single bar stamped with the last one
+        columns = self.columns
+        self.columns = {
+            't': [columns['t'][-1]],
+            'open': [columns['open'][0]],
+            'high': [max(columns['high'])],
+            'low': [min(columns['low'])],
+            'close': [columns['close'][-1]],
+            'volume': [sum(columns['volume'])],
+            'equity': [columns['equity'][-1]],
+        }
+        self.timestamps = [self.timestamps[-1]]
+
+    def flush(self, now=None):
+        columns = self.columns
+        if not columns['t']:
+            return
+        if self.frame_seconds and len(columns['t']) > 1:
+            self._downsample()
+            columns = self.columns
+
+        if self.encoding == 'json':
+            bars = [
+                {"type": "price_update", "timestamp": timestamp, "open": o, "high": h, "low": l, "close": c, "volume": v, "equity": e}
+                for timestamp, o, h, l, c, v, e in zip(self.timestamps, columns['open'], columns['high'], columns['low'],
+                                                       columns['close'], columns['volume'], columns['equity'])
+            ]
+            message = {"type": "price_batch", "bars": bars}
+        elif self.encoding == 'compact':
+            message = {"type": "price_batch", **columns}
+        else:
+            packed = b''.join(struct.pack(STRUCT_FORMAT, *record) for record in zip(*(columns[f] for f in STRUCT_FIELDS)))
+            message = {"type": "price_batch", "format": STRUCT_FORMAT, "fields": STRUCT_FIELDS, "count": len(columns['t']),
+                       "data": base64.b64encode(packed).decode('ascii')}
+        if self.trade_events:
+            message["trade_events"] = self.trade_events
+        self.emit(json.dumps(message))
+
+        self.columns = {field: [] for field in STRUCT_FIELDS}
+        self.timestamps = []
+        self.trade_events = []
+        self.last_flush = now if now is not None else time.perf_counter()
+
+    def close(self):
+        self.flush()
+        if self.stats_seconds and self.stats_bars:
+            self._emit_stats(time.perf_counter())
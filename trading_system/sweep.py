@@ -0,0 +1,144 @@
+import heapq
+import itertools
+import json
+import os
+from multiprocessing import Pool, shared_memory
+
+import numpy as np
+
+from engine import extract_arrays, new_state, run_arrays, S_EQUITY
+from metrics import max_drawdown
+
+SWEEP_PARAMS = ['atr_mult_sl', 'atr_mult_trail', 'rr_target', 'risk_pct', 'partial_exit_pct']
+SWEEP_METRICS = ['final_equity', 'win_rate', 'avg_pnl', 'total_trades', 'max_drawdown_pct']
+
+# Set in each worker by init_worker: indicator arrays viewed from shared memory, and the caller's config
+_worker_arrays = None
+_worker_shm = None
+_worker_config = None
+
+
+def parse_grid(spec):
+    # "start:stop:step" (stop inclusive) or "a,b,c"; ValueError on malformed or empty ranges
+    if ':' in spec:
+        parts = spec.split(':')
+        if len(parts) != 3:
+            raise ValueError(f'expected "start:stop:step", got "{spec}"')
+        start, stop, step = (float(x) for x in parts)
+        if step <= 0:
+            raise ValueError(f'step must be positive in "{spec}"')
+        if stop < start:
+            raise ValueError(f'stop is below start in "{spec}"')
+        count = int(np.floor((stop - start) / step + 1e-9)) + 1
+        return [round(start + k * step, 10) for k in range(count)]
+    return [float(x) for x in spec.split(',')]
+
+
+def share_arrays(arrays):
+    # Copy the engine arrays into one shared memory block so workers map them instead of receiving pickled copies
+    layout = []
+    offset = 0
+    for name, arr in arrays.items():
+        offset = (offset + 7) // 8 * 8
+        layout.append((name, arr.dtype.str, offset, len(arr)))
+        offset += arr.nbytes
+    shm = shared_memory.SharedMemory(create=True, size=max(offset, 1))
+    for name, dtype, start, length in layout:
+        np.ndarray(length, dtype=dtype, buffer=shm.buf, offset=start)[:] = arrays[name]
+    return shm, layout
+
+
+def attach_arrays(shm, layout):
+    return {name: np.ndarray(length, dtype=dtype, buffer=shm.buf, offset=start) for name, dtype, start, length in layout}
+
+
+def init_worker(shm_name, layout, config):
+    # Pool initializer for any job over the arrays of share_arrays; also used by walkforward.py
+    global _worker_arrays, _worker_shm, _worker_config
+    _worker_shm = shared_memory.SharedMemory(name=shm_name)
+    _worker_arrays = attach_arrays(_worker_shm, layout)
+    _worker_config = config
+
+
+def worker_context():
+    # (arrays, config) set by init_worker in this worker process
+    return _worker_arrays, _worker_config
+
+
+def evaluate(arrays, params, initial_capital, unit_value, partial_exit):
+    # Summary metrics for one parameter combination; no per-trade records or timestamps are built
+    state = new_state(initial_capital)
+    trades, equity, recorded = run_arrays(arrays, state, 1, 0, params['risk_pct'], params['atr_mult_sl'], params['atr_mult_trail'],
+                                          params['rr_target'], unit_value, partial_exit, params['partial_exit_pct'])
+    pnl = trades['pnl']
+    n_trades = len(pnl)
+    wins = int((pnl > 0).sum())
+
+    max_drawdown_pct, _ = max_drawdown(np.concatenate(([initial_capital], equity[recorded])))
+
+    return {
+        **params,
+        "final_equity": float(state[S_EQUITY]) if n_trades else initial_capital,
+        "total_trades": n_trades,
+        "wins": wins,
+        "losses": int((pnl <= 0).sum()),
+        "win_rate": (wins / n_trades * 100) if n_trades > 0 else 0,
+        "avg_pnl": float(np.mean(pnl)) if n_trades > 0 else 0,
+        "max_drawdown_pct": max_drawdown_pct,
+    }
+
+
+def _evaluate_chunk(chunk):
+    initial_capital, unit_value, partial_exit = _worker_config
+    return [evaluate(_worker_arrays, params, initial_capital, unit_value, partial_exit) for params in chunk]
+
+
+def iter_combinations(grid):
+    for values in itertools.product(*(grid[p] for p in SWEEP_PARAMS)):
+        yield dict(zip(SWEEP_PARAMS, values))
+
+
+def _chunks(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def rank_key(metric):
+    # Drawdown is ranked ascending, everything else descending
+    sign = 1 if metric == 'max_drawdown_pct' else -1
+    return lambda row: sign * row[metric]
+
+
+def run_sweep(df_strategy, grid, initial_capital, unit_value, partial_exit, metric='final_equity', workers=None, chunk_size=None, top=20, emit=None):
+    # Indicators are already in df_strategy; only the bar loop runs per combination.
+    # Each finished chunk is passed to emit() ranked by `metric`; the overall top rows are returned.
+    if emit is None:
+        emit = lambda rows: print(json.dumps({"type": "sweep_results", "results": rows}), flush=True)
+    key = rank_key(metric)
+    combinations = iter_combinations(grid)
+    config = (initial_capital, unit_value, partial_exit)
+    workers = workers or os.cpu_count()
+    if chunk_size is None:
+        # Several chunks per worker keeps the pool balanced; capped so results keep streaming on large grids
+        total = int(np.prod([len(grid[p]) for p in SWEEP_PARAMS]))
+        chunk_size = max(1, min(64, total // (workers * 4)))
+    leaders = []
+    evaluated = 0
+
+    shm, layout = share_arrays(extract_arrays(df_strategy))
+    try:
+        with Pool(workers, initializer=init_worker, initargs=(shm.name, layout, config)) as pool:
+            for rows in pool.imap_unordered(_evaluate_chunk, _chunks(combinations, chunk_size)):
+                rows.sort(key=key)
+                emit(rows)
+                evaluated += len(rows)
+                leaders = heapq.nsmallest(top, leaders + rows, key=key)
+    finally:
+        shm.close()
+        shm.unlink()
+
+    return {"type": "sweep_summary", "metric": metric, "evaluated": evaluated, "top": leaders}
@@ -0,0 +1,28 @@
+import os
+import sys
+
+import pytest
+
+# The trading_system modules import each other as top-level modules (they are run as scripts from this directory)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import engine
+import portfolio
+import ticks
+
+KERNEL_MODULES = (engine, portfolio, ticks)
+
+
+@pytest.fixture(params=['numba', 'python'])
+def kernel(request, monkeypatch):
+    # 'python' runs the fallback used when numba is not installed: every compiled function in the kernel modules,
+    # the rule helpers the kernels call included, is replaced by the plain function it was compiled from
+    if request.param == 'python':
+        monkeypatch.setattr(engine, 'njit', None)
+        for module in KERNEL_MODULES:
+            for name, value in list(vars(module).items()):
+                if hasattr(value, 'py_func'):
+                    monkeypatch.setattr(module, name, value.py_func)
+    elif engine.njit is None:
+        pytest.skip('numba is not installed')
+    return request.param
@@ -0,0 +1,51 @@
+import numpy as np
+import pandas as pd
+
+from chunked import iter_strategy_chunks, load_equity_curve, load_trades, run_chunked_backtest
+from datacache import iter_ohlcv_chunks, parse_ohlcv
+from engine import run_bar_engine
+
+PARAMS = (1000, 0.01, 1.5, 2.0, 1.5, 1.0, True, 0.5)
+CHUNK_BARS = 700
+
+
+def write_bars(path, n_bars=6000, seed=0):
+    # Bar file in the exported "date time open high low close volume" format
+    rng = np.random.default_rng(seed)
+    close = 2000 + np.cumsum(rng.normal(0, 0.5, n_bars))
+    open_ = np.append(close[0], close[:-1])
+    high = np.maximum(open_, close) + rng.exponential(0.3, n_bars)
+    low = np.minimum(open_, close) - rng.exponential(0.3, n_bars)
+    index = pd.date_range('2024-01-01', periods=n_bars, freq='1min')
+    with open(path, 'w') as f:
+        for t, o, h, l, c in zip(index, open_, high, low, close):
+            f.write(f'{t:%Y.%m.%d %H:%M} {o:.2f} {h:.2f} {l:.2f} {c:.2f} 1\n')
+
+
+def breakout_strategy(df):
+    # define_strategy stand-in without pandas_ta. Rolling max / min are exact, so a bar's values do not depend on
+    # where its chunk's warm-up history starts.
+    df['ATR_14'] = df['high'].rolling(14).max() - df['low'].rolling(14).min()
+    df['long_signal'] = df['close'] > df['high'].rolling(20).max().shift(1)
+    df['short_signal'] = df['close'] < df['low'].rolling(20).min().shift(1)
+    return df
+
+
+def test_chunked_backtest_matches_in_memory(tmp_path):
+    path = str(tmp_path / 'bars.txt')
+    write_bars(path)
+    expected = run_bar_engine(breakout_strategy(parse_ohlcv(path)), *PARAMS)
+    results = run_chunked_backtest(path, breakout_strategy, str(tmp_path / 'out'), *PARAMS, chunk_bars=CHUNK_BARS)
+
+    # Some positions are open across a chunk boundary, so the carried engine state is exercised
+    boundaries = np.cumsum([len(df) for df in iter_strategy_chunks(iter_ohlcv_chunks(path, CHUNK_BARS), breakout_strategy)])[:-1]
+    times = parse_ohlcv(path).index.strftime('%Y-%m-%d %H:%M:%S')
+    trades = load_trades(results['trades_file'])
+    assert len(boundaries) > 5
+    assert any(t['entry_time'] < times[b] <= t['exit_time'] for t in trades for b in boundaries)
+
+    assert trades == expected['trades']
+    assert load_equity_curve(results['equity_curve_file']).tolist() == expected['equity_curve']
+    assert results['equity_curve_points'] == len(expected['equity_curve'])
+    for key in ('final_equity', 'total_trades', 'wins', 'losses', 'win_rate', 'avg_pnl'):
+        assert results[key] == expected[key], key
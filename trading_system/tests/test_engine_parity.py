@@ -0,0 +1,36 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from engine import run_backtest_reference, run_bar_engine
+
+
+def synthetic_strategy_frame(n_bars=3000, seed=0):
+    # define_strategy-shaped frame without pandas_ta: a random walk with random ATR values and signals.
+    # Some bars have ATR_14 == 0 so that signals on them take the `continue` path of the loop.
+    rng = np.random.default_rng(seed)
+    close = 2000 + np.cumsum(rng.normal(0, 1, n_bars))
+    high = close + rng.exponential(0.8, n_bars)
+    low = close - rng.exponential(0.8, n_bars)
+    atr = rng.uniform(0.5, 3.0, n_bars)
+    atr[rng.random(n_bars) < 0.05] = 0.0
+    long_signal = rng.random(n_bars) < 0.04
+    short_signal = ~long_signal & (rng.random(n_bars) < 0.04)
+    index = pd.date_range('2024-01-01', periods=n_bars, freq='1min', name='datetime')
+    return pd.DataFrame({'open': close, 'high': high, 'low': low, 'close': close, 'volume': 1, 'ATR_14': atr,
+                         'long_signal': long_signal, 'short_signal': short_signal}, index=index)
+
+
+@pytest.mark.parametrize('seed', [0, 1, 2])
+@pytest.mark.parametrize('partial_exit', [True, False])
+def test_bar_engine_matches_reference_loop(kernel, seed, partial_exit):
+    df = synthetic_strategy_frame(seed=seed)
+    assert ((df['ATR_14'] == 0) & (df['long_signal'] | df['short_signal'])).any()
+    params = (1000, 0.01, 1.5, 2.0, 1.5, 1.0, partial_exit, 0.5)
+
+    expected = run_backtest_reference(df, *params)
+    actual = run_bar_engine(df, *params)
+
+    assert expected['total_trades'] > 50
+    for key in expected:
+        assert actual[key] == expected[key], key
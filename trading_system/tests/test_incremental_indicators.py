@@ -0,0 +1,108 @@
+import math
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from indicators import Atr, Rsi, TalibAtr, TalibRsi, TalibSma, RollingMean, replay
+
+
+def synthetic_bars(n_bars=6000, seed=0):
+    rng = np.random.default_rng(seed)
+    close = np.round(2000 + np.cumsum(rng.normal(0, 0.5, n_bars)), 2)
+    open_ = np.round(np.append(close[0], close[:-1]) + rng.normal(0, 0.1, n_bars), 2)
+    high = np.maximum(open_, close) + np.round(rng.exponential(0.3, n_bars), 2)
+    low = np.minimum(open_, close) - np.round(rng.exponential(0.3, n_bars), 2)
+    index = pd.date_range('2024-01-01', periods=n_bars, freq='1min', name='datetime')
+    return pd.DataFrame({'open': open_, 'high': high, 'low': low, 'close': close, 'volume': rng.integers(1, 100, n_bars)}, index=index)
+
+
+def true_range(df):
+    prev_close = df['close'].shift(1)
+    return pd.concat([df['high'] - df['low'], (prev_close - df['high']).abs(), (prev_close - df['low']).abs()], axis=1).max(axis=1, skipna=False)
+
+
+def wilder_seeded(values, length):
+    # TA-Lib's smoothing: NaN until `length` values, their plain mean, then (prev * (length - 1) + x) / length
+    out = np.full(len(values), np.nan)
+    start = np.flatnonzero(~np.isnan(values))[0]
+    if len(values) - start < length:
+        return out
+    value = sum(values[start:start + length].tolist()) / length
+    out[start + length - 1] = value
+    for i in range(start + length, len(values)):
+        value = (value * (length - 1) + values[i]) / length
+        out[i] = value
+    return out
+
+
+def test_talib_atr_is_sma_seeded():
+    df = synthetic_bars(500)
+    expected = wilder_seeded(true_range(df).to_numpy(), 14)
+    atr = TalibAtr(14)
+    actual = [atr.update(h, l, c) for h, l, c in zip(df['high'], df['low'], df['close'])]
+    assert np.isnan(actual[:14]).all() and not math.isnan(actual[14])
+    np.testing.assert_allclose(actual, expected, rtol=1e-12)
+
+
+def test_talib_rsi_is_sma_seeded():
+    close = synthetic_bars(500)['close']
+    change = close.diff().to_numpy()
+    gain = wilder_seeded(np.where(change > 0, change, np.where(np.isnan(change), np.nan, 0.0)), 14)
+    loss = wilder_seeded(np.where(change < 0, -change, np.where(np.isnan(change), np.nan, 0.0)), 14)
+    rsi = TalibRsi(14)
+    actual = [rsi.update(c) for c in close]
+    np.testing.assert_allclose(actual, 100 * gain / (gain + loss), rtol=1e-12)
+
+
+def test_talib_sma_matches_rolling_mean():
+    close = synthetic_bars(500)['close']
+    sma = TalibSma(20)
+    np.testing.assert_allclose([sma.update(c) for c in close], close.rolling(20).mean(), rtol=1e-12)
+
+
+def test_pandas_path_matches_ewm():
+    # pandas_ta without TA-Lib: rma = ewm(alpha=1 / length, min_periods=length)
+    df = synthetic_bars(500)
+    atr = Atr(14)
+    expected = true_range(df).ewm(alpha=1 / 14, min_periods=14).mean()
+    np.testing.assert_array_equal([atr.update(h, l, c) for h, l, c in zip(df['high'], df['low'], df['close'])], expected)
+    rsi = Rsi(14)
+    change = df['close'].diff()
+    gain = change.clip(lower=0).ewm(alpha=1 / 14, min_periods=14).mean()
+    loss = change.clip(upper=0).ewm(alpha=1 / 14, min_periods=14).mean()
+    np.testing.assert_array_equal([rsi.update(c) for c in df['close']], 100 * gain / (gain + loss.abs()))
+    sma = RollingMean(50)
+    np.testing.assert_array_equal([sma.update(c) for c in df['close']], df['close'].rolling(50).mean())
+
+
+def test_talib_indicators_match_talib():
+    talib = pytest.importorskip('talib')
+    df = synthetic_bars(2000)
+    high, low, close = (df[c].to_numpy(dtype=np.float64) for c in ('high', 'low', 'close'))
+    atr, rsi, sma = TalibAtr(14), TalibRsi(14), TalibSma(20)
+    np.testing.assert_array_equal([atr.update(h, l, c) for h, l, c in zip(high, low, close)], talib.ATR(high, low, close, 14))
+    np.testing.assert_array_equal([rsi.update(c) for c in close], talib.RSI(close, 14))
+    np.testing.assert_array_equal([sma.update(c) for c in close], talib.SMA(close, 20))
+
+
+def test_replay_matches_define_strategy():
+    # define_strategy needs pandas_ta, and pandas_ta needs TA-Lib for the candle patterns
+    pytest.importorskip('pandas_ta')
+    pytest.importorskip('talib')
+    from backtester import define_strategy
+
+    df = synthetic_bars()
+    batch = define_strategy(df.copy())
+    stream = replay(df)
+    for column in ('ATR_14', 'RSI_14', 'SMA_20', 'SMA_50'):
+        np.testing.assert_array_equal(stream[column].to_numpy(), batch[column].to_numpy(dtype=np.float64), err_msg=column)
+    for column in ('CDL_ENGULFING', 'CDL_HAMMER'):
+        np.testing.assert_array_equal(stream[column].to_numpy(), batch[column].to_numpy(), err_msg=column)
+
+    # The batch regime of a bar uses its hour's final close; the stream's is what the batch code says when the data ends there
+    for end in range(60, len(df) + 1, 97):
+        prefix = define_strategy(df.iloc[:end].copy())
+        assert stream['regime'].iloc[end - 1] == prefix['regime'].iloc[-1], end
+        assert stream['long_signal'].iloc[end - 1] == prefix['long_signal'].iloc[-1], end
+        assert stream['short_signal'].iloc[end - 1] == prefix['short_signal'].iloc[-1], end
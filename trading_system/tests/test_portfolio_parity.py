@@ -0,0 +1,28 @@
+import pytest
+
+from engine import extract_arrays, run_bar_engine
+from indicators import index_to_ns
+from portfolio import run_portfolio
+from test_engine_parity import synthetic_strategy_frame
+
+
+@pytest.mark.parametrize('seed', [0, 1])
+@pytest.mark.parametrize('partial_exit', [True, False])
+@pytest.mark.parametrize('unit_value', [1.0, 2.5])
+def test_single_symbol_portfolio_matches_bar_engine(kernel, seed, partial_exit, unit_value):
+    df = synthetic_strategy_frame(seed=seed)
+    arrays = extract_arrays(df)
+    arrays['time'] = index_to_ns(df.index)
+    initial_capital, risk_pct, atr_mult_sl, atr_mult_trail, rr_target, partial_exit_pct = 1000, 0.01, 1.5, 2.0, 1.5, 0.5
+
+    expected = run_bar_engine(df, initial_capital, risk_pct, atr_mult_sl, atr_mult_trail, rr_target, unit_value, partial_exit,
+                              partial_exit_pct)
+    actual = run_portfolio([('A', unit_value)], [arrays], initial_capital, risk_pct, atr_mult_sl, atr_mult_trail, rr_target,
+                           partial_exit, partial_exit_pct)
+
+    assert expected['total_trades'] > 50
+    assert [{k: v for k, v in t.items() if k != 'symbol'} for t in actual['trades']] == expected['trades']
+    assert actual['equity_curve'] == expected['equity_curve']
+    for key in ('final_equity', 'total_trades', 'wins', 'losses', 'win_rate', 'avg_pnl'):
+        assert actual[key] == expected[key], key
+    assert actual['symbols']['A']['total_trades'] == expected['total_trades']
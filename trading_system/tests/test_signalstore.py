@@ -0,0 +1,39 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from signalstore import load_or_compute, load_signals, save_signals, store_key
+
+
+def strategy_frame(n_bars=200, seed=0):
+    rng = np.random.default_rng(seed)
+    close = 2000 + np.cumsum(rng.normal(0, 1, n_bars))
+    index = pd.date_range('2024-01-01', periods=n_bars, freq='1min', name='datetime')
+    df = pd.DataFrame({'open': close, 'high': close + 1, 'low': close - 1, 'close': close, 'volume': 1}, index=index)
+    df_strategy = df.copy()
+    df_strategy['ATR_14'] = rng.uniform(0.5, 3.0, n_bars)
+    df_strategy['long_signal'] = rng.random(n_bars) < 0.1
+    df_strategy['regime'] = pd.Categorical.from_codes(rng.integers(-1, 2, n_bars), categories=['UNKNOWN', 'TREND_UP'])
+    return df, df_strategy
+
+
+def test_store_round_trip(tmp_path):
+    df, df_strategy = strategy_frame()
+    key = store_key(df, {'atr': 14})
+    save_signals(df_strategy, key, str(tmp_path))
+    pd.testing.assert_frame_equal(load_signals(df, key, str(tmp_path)), df_strategy)
+
+
+def test_entry_evicted_while_loading_is_a_miss(tmp_path):
+    # Another worker's evict() removed the column files after this one read meta.json
+    df, df_strategy = strategy_frame()
+    key = store_key(df, {'atr': 14})
+    save_signals(df_strategy, key, str(tmp_path))
+    os.remove(os.path.join(str(tmp_path), key, 'ATR_14.npy'))
+    assert load_signals(df, key, str(tmp_path)) is None
+
+    computed = []
+    result = load_or_compute(df, lambda: computed.append(1) or df_strategy, {'atr': 14}, str(tmp_path))
+    assert computed == [1]
+    pd.testing.assert_frame_equal(result, df_strategy)
@@ -0,0 +1,222 @@
+import numpy as np
+import pandas as pd
+
+from datacache import OHLCV_COLUMNS
+from engine import (ENGINE_COLUMNS, LONG, LONG_PARTIAL, S_ENTRY_IDX, S_ENTRY_PRICE, S_EQUITY, S_EXTREME, S_PARTIAL, S_QTY, S_SIDE,
+                    S_STOP, S_TP, SHORT, SHORT_PARTIAL, build_results, extract_arrays, jit_kernel, kernel_inputs, new_state,
+                    open_position, partial_target, position_pnl, trade_buffers, trail_stop, trim_trades)
+from indicators import index_to_ns
+from profiler import stage
+
+# Tick-resolution backtest. Tick files are whitespace separated "date time price volume" rows in time order
+# (e.g. "2024.01.01 00:17:03.250 2001.05 3"). They are aggregated into bars for define_strategy, and the bars
+# in which a position is open are then replayed tick by tick, so stop, trailing stop, partial and take-profit
+# fills happen in the order the prices actually traded instead of the bar engine's fixed order.
+
+TICK_FILE_COLUMNS = ['date', 'time', 'price', 'volume']
+DEFAULT_TICK_CHUNK = 2_000_000
+DEFAULT_BAR_PERIOD = '1min'
+
+
+def iter_tick_chunks(filepath, chunk_ticks=DEFAULT_TICK_CHUNK):
+    # (times in ns, prices, volumes) arrays, chunk_ticks rows at a time
+    with pd.read_csv(filepath, header=None, sep=r'\s+', names=TICK_FILE_COLUMNS, chunksize=chunk_ticks) as reader:
+        while True:
+            with stage('parse'):
+                chunk = next(reader, None)
+                if chunk is None:
+                    return
+                times = index_to_ns(pd.DatetimeIndex(pd.to_datetime(chunk['date'] + ' ' + chunk['time'])))
+                prices = chunk['price'].to_numpy(dtype=np.float64)
+                volumes = chunk['volume'].to_numpy()
+            yield times, prices, volumes
+
+
+def aggregate_ticks(times, prices, volumes, bar_ns):
+    # OHLCV bars (labelled with their start time, like DataFrame.resample) and the tick count of every bar.
+    # Bars without ticks are left out, as in the exported bar files.
+    bar_ids = times // bar_ns
+    starts = np.flatnonzero(np.concatenate(([True], bar_ids[1:] != bar_ids[:-1])))
+    ends = np.append(starts[1:], len(times))
+    index = pd.DatetimeIndex((bar_ids[starts] * bar_ns).view('datetime64[ns]'), name='datetime')
+    bars = pd.DataFrame({
+        'open': prices[starts],
+        'high': np.maximum.reduceat(prices, starts),
+        'low': np.minimum.reduceat(prices, starts),
+        'close': prices[ends - 1],
+        'volume': np.add.reduceat(volumes, starts),
+    }, index=index, columns=OHLCV_COLUMNS)
+    return bars, ends - starts
+
+
+def resample_ticks(chunks, bar_ns):
+    # Streaming resampler: yields (bars, tick counts, tick prices) per chunk. The last bar of a chunk may
+    # continue in the next one, so its ticks are held back and prepended to the next chunk.
+    held = None
+    last_ns = None
+    for times, prices, volumes in chunks:
+        if len(times) == 0:
+            continue
+        if (last_ns is not None and times[0] < last_ns) or (np.diff(times) < 0).any():
+            raise ValueError('ticks are not sorted by time')
+        last_ns = times[-1]
+        if held is not None:
+            times, prices, volumes = (np.concatenate(pair) for pair in zip(held, (times, prices, volumes)))
+        cut = np.searchsorted(times, times[-1] // bar_ns * bar_ns)
+        held = (times[cut:], prices[cut:], volumes[cut:])
+        if cut:
+            with stage('resample'):
+                bars, counts = aggregate_ticks(times[:cut], prices[:cut], volumes[:cut], bar_ns)
+            yield bars, counts, prices[:cut]
+    if held is not None:
+        with stage('resample'):
+            bars, counts = aggregate_ticks(*held, bar_ns)
+        yield bars, counts, held[1]
+
+
+def load_ticks(filepath, bar_period=DEFAULT_BAR_PERIOD, chunk_ticks=DEFAULT_TICK_CHUNK):
+    # Bars for define_strategy, every tick price, and tick_start: the ticks of bar i are tick_start[i]:tick_start[i + 1]
+    bar_ns = pd.Timedelta(bar_period).value
+    if bar_ns <= 0:
+        raise ValueError(f'bar period must be positive: {bar_period}')
+    parts = list(resample_ticks(iter_tick_chunks(filepath, chunk_ticks), bar_ns))
+    if not parts:
+        raise ValueError(f'no ticks in {filepath}')
+    bars = pd.concat([b for b, _, _ in parts])
+    tick_start = np.concatenate(([0], np.cumsum(np.concatenate([c for _, c, _ in parts]))))
+    tick_prices = np.concatenate([p for _, _, p in parts])
+    return bars, tick_prices, tick_start
+
+
+def _tick_bar_loop(high, low, close, atr, long_signal, short_signal, tick_price, tick_start, state, start,
+                   risk_pct, atr_mult_sl, atr_mult_trail, rr_target, unit_value, partial_exit, partial_exit_pct,
+                   trade_entry, trade_exit, trade_pnl, trade_kind, equity_curve, recorded):
+    # engine._bar_loop with the exits of an open position resolved on the ticks of the bar:
+    #   - per tick: partial target, then the trailing stop follows the new extreme, then stop / take profit
+    #   - the trail distance uses the ATR of the last closed bar (bar i's ATR includes its own close); it is applied
+    #     once when the bar opens and again whenever a tick makes a new extreme
+    #   - limits (partial, take profit) fill at their price; a stop fills at the tick that crossed it, so gaps slip
+    #   - the extreme starts at the entry close, the only price traded while the position was open in the entry bar
+    # A bar whose range reaches no level and makes no new extreme cannot change the position and skips its ticks.
+    # Returns the trade count, the bars replayed tick by tick and the ticks scanned.
+    n_trades = 0
+    tick_bars = 0
+    ticks_scanned = 0
+    equity = state[S_EQUITY]
+    side = state[S_SIDE]
+    entry_price = state[S_ENTRY_PRICE]
+    stop_loss = state[S_STOP]
+    take_profit = state[S_TP]
+    quantity = state[S_QTY]
+    partial_exited = state[S_PARTIAL] != 0.0
+    extreme = state[S_EXTREME]
+    entry_idx = int(state[S_ENTRY_IDX])
+
+    for i in range(start, len(close)):
+        if side == 0.0:
+            direction = 1.0 if long_signal[i] else (-1.0 if short_signal[i] else 0.0)
+            if direction != 0.0:
+                sl_dist, qty, new_stop, new_tp = open_position(direction, close[i], atr[i], equity, risk_pct, atr_mult_sl, rr_target, unit_value)
+                if sl_dist == 0:
+                    continue
+                if qty > 0:
+                    side = direction
+                    entry_price = close[i]
+                    stop_loss = new_stop
+                    take_profit = new_tp
+                    quantity = qty
+                    partial_exited = False
+                    extreme = close[i]
+                    entry_idx = i
+
+        else:
+            trail_dist = atr[i - 1] * atr_mult_trail
+            stop_loss = trail_stop(side, extreme, stop_loss, trail_dist)
+            partial_tp_price = partial_target(side, entry_price, take_profit)
+            partial_pending = partial_exit and not partial_exited
+            # Prices are compared multiplied by side, so that "in the position's favour" is always larger
+            best = side * (high[i] if side == 1.0 else low[i])
+            worst = side * (low[i] if side == 1.0 else high[i])
+            if (best > side * extreme or worst <= side * stop_loss or best >= side * take_profit
+                    or (partial_pending and best >= side * partial_tp_price)):
+                tick_bars += 1
+                for k in range(tick_start[i], tick_start[i + 1]):
+                    ticks_scanned += 1
+                    price = tick_price[k]
+                    if partial_pending and side * price >= side * partial_tp_price:
+                        partial_qty = quantity * partial_exit_pct
+                        pnl = position_pnl(side, entry_price, partial_tp_price, partial_qty, unit_value)
+                        equity += pnl
+                        trade_entry[n_trades] = entry_idx
+                        trade_exit[n_trades] = i
+                        trade_pnl[n_trades] = pnl
+                        trade_kind[n_trades] = LONG_PARTIAL if side == 1.0 else SHORT_PARTIAL
+                        n_trades += 1
+                        quantity -= partial_qty
+                        partial_exited = True
+                        partial_pending = False
+
+                    if side * price > side * extreme:
+                        extreme = price
+                        stop_loss = trail_stop(side, extreme, stop_loss, trail_dist)
+
+                    exit_price = np.nan
+                    if side * price <= side * stop_loss:
+                        exit_price = price
+                    elif side * price >= side * take_profit:
+                        exit_price = take_profit
+                    if exit_price == exit_price:
+                        pnl = position_pnl(side, entry_price, exit_price, quantity, unit_value)
+                        equity += pnl
+                        trade_entry[n_trades] = entry_idx
+                        trade_exit[n_trades] = i
+                        trade_pnl[n_trades] = pnl
+                        trade_kind[n_trades] = LONG if side == 1.0 else SHORT
+                        n_trades += 1
+                        side = 0.0
+                        break
+
+        equity_curve[i] = equity
+        recorded[i] = True
+
+    state[S_EQUITY] = equity
+    state[S_SIDE] = side
+    state[S_ENTRY_PRICE] = entry_price
+    state[S_STOP] = stop_loss
+    state[S_TP] = take_profit
+    state[S_QTY] = quantity
+    state[S_PARTIAL] = 1.0 if partial_exited else 0.0
+    state[S_EXTREME] = extreme
+    state[S_ENTRY_IDX] = entry_idx
+    return n_trades, tick_bars, ticks_scanned
+
+
+tick_bar_loop = jit_kernel(_tick_bar_loop)
+
+
+def run_tick_backtest(df, tick_prices, tick_start, initial_capital, risk_pct, atr_mult_sl, atr_mult_trail, rr_target, unit_value,
+                      partial_exit, partial_exit_pct, equity_points=None, equity_file=None):
+    # df: define_strategy output for the bars of load_ticks; same results as run_backtest plus an "intrabar" block
+    if len(tick_start) != len(df) + 1 or tick_start[-1] != len(tick_prices):
+        raise ValueError('tick_start does not match the bars and ticks')
+    with stage('bar_loop'):
+        arrays = extract_arrays(df)
+        state = new_state(initial_capital)
+        n = len(df)
+        trades = trade_buffers(n + 2)
+        equity = np.empty(n, dtype=np.float64)
+        recorded = np.zeros(n, dtype=np.bool_)
+
+        n_trades, tick_bars, ticks_scanned = tick_bar_loop(
+            *kernel_inputs([*(arrays[c] for c in ENGINE_COLUMNS), tick_prices, tick_start]), state, 1,
+            risk_pct, atr_mult_sl, atr_mult_trail, rr_target, unit_value, bool(partial_exit), partial_exit_pct,
+            *trades.values(), equity, recorded)
+
+    results = build_results(df, trim_trades(trades, n_trades), state, equity, recorded, initial_capital, equity_points, equity_file)
+    results["intrabar"] = {
+        "bars": n,
+        "ticks": int(len(tick_prices)),
+        "tick_resolved_bars": tick_bars,
+        "ticks_scanned": ticks_scanned,
+    }
+    return results
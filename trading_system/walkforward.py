@@ -0,0 +1,101 @@
+import json
+import math
+import os
+from multiprocessing import Pool
+
+import pandas as pd
+
+from engine import TIME_FORMAT, extract_arrays
+from sweep import evaluate, init_worker, iter_combinations, rank_key, share_arrays, worker_context
+
+# Walk-forward study: for every fold the grid is swept on the train window and the best combination is
+# evaluated on the test window that follows it. Indicators come from one define_strategy pass over the whole
+# series, so each window starts with fully warmed-up values; folds only slice the shared engine arrays.
+
+WALK_FORWARD_MODES = ['rolling', 'anchored']
+FOLD_METRICS = ['final_equity', 'total_trades', 'win_rate', 'avg_pnl', 'max_drawdown_pct']
+
+def make_folds(index, train_period, test_period, mode='rolling'):
+    # (train_start, train_end, test_end) bar positions; test windows are consecutive and never overlap.
+    # rolling: the train window keeps its length and moves with the test window; anchored: it always starts at the first bar.
+    train = pd.Timedelta(train_period)
+    test = pd.Timedelta(test_period)
+    first, last = index[0], index[-1]
+    folds = []
+    train_start, train_end = first, first + train
+    while train_end <= last:
+        start, end, test_end = index.searchsorted([train_start, train_end, train_end + test])
+        # A window needs two bars: the engine starts at a window's second bar
+        if end - start >= 2 and test_end - end >= 2:
+            folds.append((int(start), int(end), int(test_end)))
+        train_end += test
+        if mode == 'rolling':
+            train_start += test
+    return folds
+
+
+def _window(arrays, start, end):
+    return {name: values[start:end] for name, values in arrays.items()}
+
+
+def _run_fold(task):
+    fold, (start, end, test_end) = task
+    arrays, (grid, metric, initial_capital, unit_value, partial_exit) = worker_context()
+    train = _window(arrays, start, end)
+    best = min((evaluate(train, params, initial_capital, unit_value, partial_exit) for params in iter_combinations(grid)),
+               key=rank_key(metric))
+    params = {name: best[name] for name in grid}
+    test = evaluate(_window(arrays, end, test_end), params, initial_capital, unit_value, partial_exit)
+    return fold, params, best, test
+
+
+def run_walk_forward(df_strategy, grid, initial_capital, unit_value, partial_exit, train_period, test_period, mode='rolling',
+                     metric='final_equity', workers=None, emit=None):
+    # Each finished fold is passed to emit(); the summary lists all folds in order plus the chained out-of-sample result
+    if emit is None:
+        emit = lambda row: print(json.dumps({"type": "walk_forward_fold", **row}), flush=True)
+    index = df_strategy.index
+    folds = make_folds(index, train_period, test_period, mode)
+    if not folds:
+        raise ValueError('no complete train / test window fits in the data')
+    config = (grid, metric, initial_capital, unit_value, partial_exit)
+    workers = min(workers or os.cpu_count(), len(folds))
+    rows = []
+
+    shm, layout = share_arrays(extract_arrays(df_strategy))
+    try:
+        with Pool(workers, initializer=init_worker, initargs=(shm.name, layout, config)) as pool:
+            for fold, params, train, test in pool.imap_unordered(_run_fold, enumerate(folds)):
+                start, end, test_end = folds[fold]
+                row = {
+                    "fold": fold,
+                    "train_start": index[start].strftime(TIME_FORMAT),
+                    "train_end": index[end - 1].strftime(TIME_FORMAT),
+                    "test_start": index[end].strftime(TIME_FORMAT),
+                    "test_end": index[test_end - 1].strftime(TIME_FORMAT),
+                    "params": params,
+                    "train": {m: train[m] for m in FOLD_METRICS},
+                    "test": {m: test[m] for m in FOLD_METRICS},
+                }
+                emit(row)
+                rows.append(row)
+    finally:
+        shm.close()
+        shm.unlink()
+
+    rows.sort(key=lambda row: row['fold'])
+    # Out-of-sample equity if every test window had been traded in turn with its fold's parameters
+    growth = 1.0
+    for row in rows:
+        growth *= row['test']['final_equity'] / initial_capital
+    test_trades = sum(row['test']['total_trades'] for row in rows)
+    return {
+        "type": "walk_forward_summary",
+        "mode": mode,
+        "metric": metric,
+        "folds": rows,
+        "combinations_per_fold": math.prod(len(values) for values in grid.values()),
+        "test_final_equity": initial_capital * growth,
+        "test_total_trades": test_trades,
+        "test_profitable_folds": sum(row['test']['final_equity'] > initial_capital for row in rows),
+    }
@@ -0,0 +1,84 @@
+import json
+import sys
+import traceback
+from collections import OrderedDict
+
+# Long-lived request loop for backtester.py --serve.
+# Protocol: one JSON request per line on stdin, e.g.
+#   {"id": "42", "command": "backtest", "filepath": "...", "params": {"atr_mult_sl": 1.094, ...}}
+# and one JSON message per line on stdout, always tagged with the request id:
+#   {"id": "42", "type": "result", "result": {...}}
+#   {"id": "42", "type": "event", "event": {...}}      (stream command only, before its result)
+#   {"id": "42", "type": "error", "message": "..."}
+# Requests are handled one at a time; run several workers for concurrency.
+
+
+class LRUCache:
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.items = OrderedDict()
+
+    def get(self, key, compute):
+        if key in self.items:
+            self.items.move_to_end(key)
+            return self.items[key]
+        value = compute()
+        self.items[key] = value
+        while len(self.items) > self.capacity:
+            self.items.popitem(last=False)
+        return value
+
+    def clear(self):
+        self.items.clear()
+
+
+class Responder:
+    def __init__(self, outfile, request_id):
+        self.outfile = outfile
+        self.prefix = '{"id": ' + json.dumps(request_id) + ', '
+
+    def _write(self, body):
+        self.outfile.write(self.prefix + body + '}\n')
+        self.outfile.flush()
+
+    def event_line(self, line):
+        # `line` is already JSON encoded; it is embedded without decoding it again
+        self._write('"type": "event", "event": ' + line)
+
+    def result(self, result):
+        self._write('"type": "result", "result": ' + json.dumps(result))
+
+    def error(self, message):
+        self._write('"type": "error", "message": ' + json.dumps(message))
+
+
+def serve(handlers, infile=sys.stdin, outfile=sys.stdout):
+    # handlers: command name -> function(request, responder) returning the result payload
+    ready = Responder(outfile, None)
+    ready.result({"ready": True, "commands": sorted(handlers) + ["ping", "shutdown"]})
+    for line in infile:
+        if not line.strip():
+            continue
+        try:
+            request = json.loads(line)
+        except ValueError as e:
+            Responder(outfile, None).error(f"invalid request: {e}")
+            continue
+        if not isinstance(request, dict):
+            Responder(outfile, None).error("invalid request: expected a JSON object")
+            continue
+        responder = Responder(outfile, request.get('id'))
+        command = request.get('command')
+        if command == 'ping':
+            responder.result({"pong": True})
+        elif command == 'shutdown':
+            responder.result({"shutdown": True})
+            return
+        elif command not in handlers:
+            responder.error(f"unknown command: {command}")
+        else:
+            try:
+                responder.result(handlers[command](request, responder))
+            except Exception as e:
+                traceback.print_exc(file=sys.stderr)
+                responder.error(f"{type(e).__name__}: {e}")